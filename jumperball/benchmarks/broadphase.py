@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Compare the World.collide broadphases for growing ball counts.
+
+Usage: python benchmarks/broadphase.py [max_balls]
+
+For each ball count a world is filled with random balls, warmed up for a
+few steps so that balls are in contact, and then the collide pass is
+timed with each broadphase, all starting from the same warmed up state.
+The state is restored before each pass, so every pass builds the
+contact pairs again instead of using the cached ones.
+The point where the uniform grid starts to beat the sweep and prune is
+reported at the end.
+"""
+from __future__ import print_function
+import os
+import sys
+from random import Random
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from simulation.geometry import Point, Vector
+from simulation.shapes import CircleShape
+from simulation.world import World
+from simulation.broadphase import BruteForce, UniformGrid, SweepAndPrune
+
+BROADPHASES = [
+	('brute', BruteForce),
+	('grid', UniformGrid),
+	('sap', SweepAndPrune),
+]
+
+def build_world(count, seed=1):
+	""" A world with enough area for count balls with radius 5 to 10 """
+	random = Random(seed)
+	side = int((count * 1000) ** 0.5) + 100
+	world = World(side, side)
+	world.gravity = Vector(0, 0.2)
+	for i in range(count):
+		x, y = random.uniform(10, side-10), random.uniform(10, side-10)
+		world.add(CircleShape(Point(x, y), random.randint(5, 10)))
+	for i in range(10):
+		world.step()
+	return world
+
+def time_collide(world, broadphase, state, budget=0.5):
+	"""
+	Average seconds per collide pass from state, each pass builds the
+	contact pairs with the broadphase
+	"""
+	world.broadphase = broadphase
+	world.reset_contact_stats()
+	runs = 0
+	elapsed = 0
+	while runs < 3 or elapsed < budget:
+		world.restore(state) # also drops the cached contact pairs
+		start = timer()
+		world.collide(True)
+		elapsed += timer() - start
+		runs += 1
+	assert world.contact_builds == runs
+	return elapsed / runs
+
+def main():
+	max_balls = int(sys.argv[1]) if len(sys.argv) > 1 else 3200
+	counts = []
+	count = 10
+	while count <= max_balls:
+		counts.append(count)
+		count *= 2
+	print("%8s" % "balls" + "".join("%12s" % name for name, _ in BROADPHASES))
+	results = []
+	for count in counts:
+		world = build_world(count)
+		state = world.snapshot()
+		row = {}
+		for name, broadphase in BROADPHASES:
+			# brute force is only measured while it is still reasonable
+			if name == 'brute' and count > 1600:
+				row[name] = None
+				continue
+			row[name] = time_collide(world, broadphase(), state)
+		results.append((count, row))
+		print("%8d" % count + "".join(
+			"%10.3fms" % (row[name]*1000) if row[name] is not None
+			else "%12s" % "-" for name, _ in BROADPHASES))
+	crossover = [count for count, row in results if row['grid'] < row['sap']]
+	if crossover:
+		print("grid is faster than sap from %d balls" % crossover[0])
+	else:
+		print("sap was faster than grid for every ball count")
+
+if __name__ == '__main__':
+	main()
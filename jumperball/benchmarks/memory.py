@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Memory used by the geometry and shape objects and memory allocated by
+World.step for growing ball counts.
+
+Usage: python benchmarks/memory.py [max_balls]
+
+The instance sizes are compared with all the same attributes, those
+of the base classes __slots__ too, stored in a plain attribute dict, as
+before the classes used __slots__.
+
+The allocations are traced with tracemalloc, which needs Python 3.
+"peak" is the most memory allocated at once while stepping and "kept" is
+what is still allocated after the steps. Both grow with the ball count:
+every move gives a shape new float objects for its position and
+velocity, which replace the old ones, and when the contact cache is
+rebuilt it holds new pair tuples. No Point or other temporary object
+is built per shape. ArrayWorld keeps the floats in arrays, but rebuilds
+its pair batches with the cache.
+"""
+from __future__ import print_function
+import os
+import sys
+import gc
+from random import Random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+from simulation.geometry import Point, Vector, Line
+from simulation.shapes import CircleShape
+from simulation.world import World
+try:
+	from simulation.arrayworld import ArrayWorld
+except ImportError:
+	ArrayWorld = None
+
+def instance_size(obj):
+	""" Bytes used by obj, including its attribute dict if any """
+	size = sys.getsizeof(obj)
+	if hasattr(obj, '__dict__'):
+		size += sys.getsizeof(obj.__dict__)
+	return size
+
+def slot_names(cls):
+	""" The __slots__ of cls and of its base classes """
+	names = []
+	for base in cls.__mro__:
+		slots = base.__dict__.get('__slots__', ())
+		if isinstance(slots, str):
+			slots = (slots,)
+		names.extend(name for name in slots
+			if name not in ('__dict__', '__weakref__') and name not in names)
+	return names
+
+def dict_size(obj):
+	"""
+	Bytes used by a dict based object with the same attributes, of a
+	class of its own as the instance dicts of a class share their keys
+	"""
+	plain = type('Plain' + type(obj).__name__, (object,), {})()
+	for name in slot_names(type(obj)):
+		if hasattr(obj, name):
+			setattr(plain, name, getattr(obj, name))
+	return instance_size(plain)
+
+def build_world(count, world_class=World, seed=1):
+	random = Random(seed)
+	side = int((count * 1000) ** 0.5) + 100
+	world = world_class(side, side)
+	world.gravity = Vector(0, 0.2)
+	world.sleep_steps = 0 # keep every ball awake
+	world.lines.append(Line(Point(0, side/2), Point(side, side/2 + 50)))
+	for i in range(count):
+		x, y = random.uniform(10, side-10), random.uniform(10, side-10)
+		world.add(CircleShape(Point(x, y), random.randint(5, 10)))
+	return world
+
+def step_allocations(world, steps=5, warm_up=60):
+	""" Returns (peak bytes, bytes kept) allocated while stepping """
+	for i in range(warm_up): # fill the reused buffers and grid cells
+		world.step()
+	gc.collect()
+	tracemalloc.start()
+	start = tracemalloc.get_traced_memory()[0]
+	for i in range(steps):
+		world.step()
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return peak - start, current - start
+
+def main():
+	max_balls = int(sys.argv[1]) if len(sys.argv) > 1 else 1600
+	print("instance sizes (bytes)")
+	print("%12s %8s %8s" % ("", "slots", "dict"))
+	for name, obj in (
+			('Point', Point(1.0, 2.0)),
+			('Vector', Vector(1.0, 2.0)),
+			('Line', Line(Point(0, 0), Point(1, 1))),
+			('CircleShape', CircleShape(Point(1.0, 2.0), 10))):
+		print("%12s %8d %8d" % (name, instance_size(obj), dict_size(obj)))
+
+	if tracemalloc is None:
+		print("tracemalloc is not available, run with Python 3 to trace the"
+			" World.step allocations")
+		return
+	backends = [World]
+	if ArrayWorld is not None:
+		backends.append(ArrayWorld)
+	for world_class in backends:
+		print()
+		print("%s.step allocations (bytes for 5 steps)" % world_class.__name__)
+		print("%8s %10s %10s %12s %12s" % (
+			"balls", "peak", "kept", "peak-kept", "kept/ball"))
+		count = 100
+		while count <= max_balls:
+			world = build_world(count, world_class)
+			peak, kept = step_allocations(world)
+			print("%8d %10d %10d %12d %12.1f" % (
+				count, peak, kept, peak - kept, kept / float(count)))
+			count *= 2
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,60 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Steps per second of a big world stepped in strips by ParallelWorld.
+
+Usage: python benchmarks/parallel.py [balls] [max_strips]
+
+The same world is stepped by the serial World and then by ParallelWorld
+with 1, 2, 4, ... strips, up to max_strips (the number of cores by
+default). The strips only run in parallel with enough cores.
+"""
+from __future__ import print_function
+import os
+import sys
+from multiprocessing import cpu_count
+from random import Random
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from simulation.geometry import Point, Vector, Line
+from simulation.shapes import CircleShape
+from simulation.world import World
+from simulation.parallel import ParallelWorld
+
+def build_world(count, seed=1):
+	random = Random(seed)
+	side = int((count * 1000) ** 0.5) + 100
+	world = World(side, side)
+	world.gravity = Vector(0, 0.2)
+	world.sleep_steps = 0
+	world.lines.append(Line(Point(0, side*0.7), Point(side, side*0.8)))
+	for i in range(count):
+		x, y = random.uniform(10, side-10), random.uniform(10, side-10)
+		world.add(CircleShape(Point(x, y), random.randint(5, 10)))
+	return world
+
+def steps_per_second(stepper, steps=20):
+	stepper.step() # warm up
+	start = timer()
+	for i in range(steps):
+		stepper.step()
+	return steps / (timer() - start)
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+	max_strips = int(sys.argv[2]) if len(sys.argv) > 2 else cpu_count()
+	print("%d balls, %d cores" % (count, cpu_count()))
+	serial = steps_per_second(build_world(count))
+	print("%10s %10.1f steps/s" % ("serial", serial))
+	strips = 1
+	while strips <= max(max_strips, 1):
+		parallel = ParallelWorld(build_world(count), strips)
+		rate = steps_per_second(parallel)
+		parallel.close()
+		print("%3d strips %10.1f steps/s %6.2fx" % (strips, rate, rate / serial))
+		strips *= 2
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,266 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+World.step throughput of standard scenes, with stored baselines.
+
+Usage:
+	python benchmarks/suite.py run [--scenes ...] [--counts ...] [-o FILE]
+	python benchmarks/suite.py compare BASELINE [CURRENT] [--threshold 0.1]
+
+The scenes are built without pygame, from a fixed seed:
+
+	falling - balls falling from random positions
+	pile - a dense pile of balls, packed at the bottom of the world
+	lines - balls piling on shelves made of many short Line segments
+	friction - balls sliding down slopes with a high friction
+	pegs - balls falling through a board of static pegs in the lower half
+
+Sleeping is off, so that the scenes keep their load while they are
+timed. For each scene and ball count, run reports the steps per second
+of the plain World.step, the mean ms per step of each phase (measured
+apart with World.profile, which slows the step) and the peak memory
+allocated while building and stepping the scene (tracemalloc, Python 3
+only, null otherwise). The results are written to a JSON file.
+
+compare runs the cases of BASELINE again, or reads them from CURRENT,
+and flags the cases which are slower, or use more memory, than the
+baseline by more than threshold. The exit status is 1 when a case
+regressed.
+"""
+from __future__ import print_function
+import os
+import sys
+import gc
+import json
+import platform
+from argparse import ArgumentParser
+from random import Random
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+from simulation.geometry import Point, Vector, Line
+from simulation.shapes import CircleShape
+from simulation.world import World
+
+def new_world(count):
+	""" A world with enough area for count balls with radius 5 to 10 """
+	side = int((count * 1000) ** 0.5) + 100
+	world = World(side, side)
+	world.gravity = Vector(0, 0.2)
+	world.sleep_steps = 0
+	return world
+
+def falling(count, random):
+	world = new_world(count)
+	side = world.width
+	for i in range(count):
+		x, y = random.uniform(10, side-10), random.uniform(10, side/2)
+		world.add(CircleShape(Point(x, y), random.randint(5, 10)))
+	return world
+
+def pile(count, random):
+	world = new_world(count)
+	side, radius = world.width, 6
+	columns = int(side // (radius*2))
+	for i in range(count):
+		row, column = divmod(i, columns)
+		x = radius + column*radius*2 + (row % 2) * radius
+		y = side - radius - row*radius*2
+		world.add(CircleShape(Point(min(x, side - radius), y), radius))
+	return world
+
+def lines(count, random):
+	world = falling(count, random)
+	side = world.width
+	# shelves of short slanted segments in the lower half, with gaps
+	for y in range(side//2, side, 60):
+		for x in range(0, side, 60):
+			drop = random.uniform(-8, 8)
+			world.lines.append(Line(Point(x, y), Point(x + 40, y + drop)))
+	return world
+
+def friction(count, random):
+	world = falling(count, random)
+	world.friction = 0.1
+	side = world.width
+	for y in range(side//4, side, side//4):
+		world.lines.append(Line(Point(0, y - 40), Point(side*2/3, y)))
+		world.lines.append(Line(Point(side, y + 20), Point(side/3, y + 60)))
+	return world
+
+def pegs(count, random):
+	world = falling(count, random)
+	side = world.width
+	for row, y in enumerate(range(side//2, side - 20, 24)):
+		for x in range(10 + (row % 2)*8, side - 10, 16):
+			world.add(CircleShape(Point(x, y), 4), static=True)
+	return world
+
+SCENES = [
+	('falling', falling),
+	('pile', pile),
+	('lines', lines),
+	('friction', friction),
+	('pegs', pegs),
+]
+
+def build(scene, count, seed=1):
+	return dict(SCENES)[scene](count, Random(seed))
+
+def time_steps(world, budget, warm_up=5, minimum=3):
+	""" Steps per second of the world, stepped for about budget seconds """
+	for i in range(warm_up):
+		world.step()
+	steps = 0
+	start = timer()
+	elapsed = 0
+	while steps < minimum or elapsed < budget:
+		world.step()
+		steps += 1
+		elapsed = timer() - start
+	return steps / elapsed
+
+def phase_times(world, steps=5):
+	""" Mean ms per step of each phase """
+	profiler = world.profile(window=steps)
+	for i in range(steps):
+		world.step()
+	world.profile(False)
+	return dict((name, stats[0]) for name, stats in profiler.stats().items())
+
+def peak_memory(scene, count, steps=3):
+	""" Bytes allocated at most while building and stepping a scene """
+	if tracemalloc is None:
+		return None
+	gc.collect()
+	tracemalloc.start()
+	world = build(scene, count)
+	for i in range(steps):
+		world.step()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return peak
+
+def run_case(scene, count, budget):
+	world = build(scene, count)
+	steps_per_second = time_steps(world, budget)
+	return {
+		'scene': scene,
+		'count': count,
+		'steps_per_second': steps_per_second,
+		'step_ms': 1000.0 / steps_per_second,
+		'phases': phase_times(world),
+		'peak_memory': peak_memory(scene, count),
+	}
+
+def case_key(scene, count):
+	return '%s/%d' % (scene, count)
+
+def run(cases, budget, out=sys.stdout):
+	""" Returns the results of the (scene, count) cases, keyed by case """
+	results = {}
+	print("%-10s %6s %10s %10s %12s" % ("scene", "balls", "steps/s",
+		"ms/step", "peak bytes"), file=out)
+	for scene, count in cases:
+		result = run_case(scene, count, budget)
+		results[case_key(scene, count)] = result
+		print("%-10s %6d %10.1f %10.3f %12s" % (scene, count,
+			result['steps_per_second'], result['step_ms'],
+			result['peak_memory'] if result['peak_memory'] is not None
+			else '-'), file=out)
+	return results
+
+def environment():
+	return {
+		'python': platform.python_version(),
+		'implementation': platform.python_implementation(),
+		'machine': platform.machine(),
+		'processor': platform.processor(),
+	}
+
+def compare(baseline, current, threshold, out=sys.stdout):
+	""" Print the changes of current against baseline, returns the regressions """
+	regressions = []
+	print("%-16s %10s %10s %8s %8s" % ("case", "baseline", "current",
+		"speed", "memory"), file=out)
+	for key in sorted(baseline, key=lambda key: (baseline[key]['scene'],
+			baseline[key]['count'])):
+		if key not in current:
+			continue
+		old, new = baseline[key], current[key]
+		speed = new['steps_per_second'] / old['steps_per_second'] - 1
+		memory = None
+		if old['peak_memory'] and new['peak_memory']:
+			memory = float(new['peak_memory']) / old['peak_memory'] - 1
+		flags = []
+		if speed < -threshold:
+			flags.append('slower')
+		if memory is not None and memory > threshold:
+			flags.append('more memory')
+		if flags:
+			regressions.append((key, flags))
+		line = "%-16s %10.1f %10.1f %+7.1f%% %8s" % (key,
+			old['steps_per_second'], new['steps_per_second'], speed*100,
+			'%+.1f%%' % (memory*100) if memory is not None else '-')
+		if flags:
+			line += " REGRESSION (%s)" % ', '.join(flags)
+		print(line, file=out)
+	return regressions
+
+def main():
+	parser = ArgumentParser(description="World.step benchmark suite")
+	commands = parser.add_subparsers(dest='command')
+	run_parser = commands.add_parser('run', help="run the scenes")
+	run_parser.add_argument('--scenes', nargs='+', default=[s for s, _ in SCENES],
+		choices=[s for s, _ in SCENES])
+	run_parser.add_argument('--counts', nargs='+', type=int,
+		default=[10, 100, 1000, 10000])
+	run_parser.add_argument('--budget', type=float, default=1.0,
+		help="seconds of timed steps per case")
+	run_parser.add_argument('-o', '--output', default='baseline.json')
+	compare_parser = commands.add_parser('compare',
+		help="compare with a baseline")
+	compare_parser.add_argument('baseline')
+	compare_parser.add_argument('current', nargs='?',
+		help="results to compare, the baseline cases are run when missing")
+	compare_parser.add_argument('--threshold', type=float, default=0.1,
+		help="relative change flagged as a regression")
+	compare_parser.add_argument('--budget', type=float, default=1.0)
+	options = parser.parse_args()
+
+	if options.command == 'run':
+		cases = [(scene, count) for scene in options.scenes
+			for count in options.counts]
+		results = run(cases, options.budget)
+		with open(options.output, 'w') as output:
+			json.dump({'environment': environment(), 'results': results},
+				output, indent=1, sort_keys=True)
+		print("results written to %s" % options.output)
+	elif options.command == 'compare':
+		with open(options.baseline) as baseline:
+			baseline = json.load(baseline)['results']
+		if options.current:
+			with open(options.current) as current:
+				current = json.load(current)['results']
+		else:
+			cases = sorted((case['scene'], case['count'])
+				for case in baseline.values())
+			current = run(cases, options.budget)
+			print()
+		regressions = compare(baseline, current, options.threshold)
+		if regressions:
+			print("%d regressions beyond %.0f%%" % (len(regressions),
+				options.threshold*100))
+			sys.exit(1)
+		print("no regressions beyond %.0f%%" % (options.threshold*100))
+	else:
+		parser.print_help()
+
+if __name__ == '__main__':
+	main()
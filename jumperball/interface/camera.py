@@ -0,0 +1,49 @@
+class Camera:
+	"""The part of the world which is shown, x, y is its top left corner.
+	It follows a target shape, smoothly, and stays inside the world.
+	"""
+	def __init__(self, size, world_size, smoothing=0.15):
+		self.width, self.height = size
+		self.world_width, self.world_height = world_size
+		self.x = self.y = 0
+		self.smoothing = smoothing #Fraction of the way moved each frame
+		self.target = None
+
+	def follow(self, shape):
+		self.target = shape
+
+	def look_at(self, x, y):
+		"""Center the view on x, y at once"""
+		self.x, self.y = x - self.width / 2, y - self.height / 2
+		self.clamp()
+
+	def move(self, dx, dy):
+		"""Pan the view, it stops following its target"""
+		self.target = None
+		self.x += dx
+		self.y += dy
+		self.clamp()
+
+	def update(self):
+		if self.target is None:
+			return
+		x = self.target.x - self.width / 2
+		y = self.target.y - self.height / 2
+		self.x += (x - self.x) * self.smoothing
+		self.y += (y - self.y) * self.smoothing
+		self.clamp()
+
+	def clamp(self):
+		self.x = max(0, min(self.x, self.world_width - self.width))
+		self.y = max(0, min(self.y, self.world_height - self.height))
+
+	def rect(self):
+		"""(left, top, right, bottom) of the view in the world"""
+		left, top = int(self.x), int(self.y)
+		return left, top, left + self.width, top + self.height
+
+	def to_world(self, x, y):
+		return x + int(self.x), y + int(self.y)
+
+	def to_screen(self, x, y):
+		return x - int(self.x), y - int(self.y)
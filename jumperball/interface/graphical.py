@@ -6,6 +6,9 @@ from random import randint, choice
 
 from simulation.geometry import Point
 from simulation.world import World
+from simulation.remote import RemoteWorld
+from interface.replay import InputRecorder, InputReplay
+from interface.camera import Camera
 
 try:
 	import android	
@@ -17,53 +20,192 @@ except ImportError:
 		
 # Graphichal presentation
 class GraphichalEngine:	
-	def __init__(self):		
+	world_class = World # or simulation.arrayworld.ArrayWorld
+	remote_physics = False # step the world in a worker process
+	world_size = None # (width, height), the display size when None
+	focus_margin = 400 # shapes further from the view are frozen
+
+	def __init__(self, headless=False):		
 		self.loopFlag = True
 				
 		#Display
 		if not ANDROID:
 			os.environ['SDL_VIDEO_CENTERED'] = '1'		
+		if headless: #Replays draw on a surface which is never shown
+			os.environ['SDL_VIDEODRIVER'] = 'dummy'
+			os.environ['SDL_AUDIODRIVER'] = 'dummy'
 		
+		width, height = 800, 480
+		self.displaySize = width, height
+		self.fps = 60		
+
+		#Physics timing, the world is stepped physics_rate times per second
+		#independently of the frame rate
+		self.physics_rate = 60
+		self.max_steps = 5 #Catch up steps per frame, before slowing down
+		self.interpolate = True
+		self.alpha = 1 #Fraction of a step elapsed since the last step
+
+		# world, a worker process is started before pygame.init(), so that
+		# it does not inherit the SDL signal handlers
+		world_width, world_height = self.world_size or self.displaySize
+		if self.remote_physics:
+			self.world = RemoteWorld(world_width, world_height,
+				self.world_class, self.physics_rate)
+		else:
+			self.world = self.world_class(world_width, world_height)
+			self.world.interpolation = self.interpolate
+		self.camera = Camera(self.displaySize, (world_width, world_height))
+
 		pygame.init()	
 		if ANDROID:
 			android.init()
 			android.accelerometer_enable(True)
 			android.map_key(android.KEYCODE_BACK, pygame.K_ESCAPE)
 			
-		width, height = 800, 480
-		self.displaySize = width, height
 		self.display = pygame.display.set_mode(self.displaySize)
-		self.fps = 60		
 
 		#Peripherals
 		self.keyboard = Keyboard()
 		self.mouse = Mouse()
+		self.recorder = None #Set by record(), logs the input of each frame
+		self.profile_font = None #Created when the F3 overlay is first shown
 				
-		# world
-		self.world = World(width, height)
-
 		#Other objects
 		self.clock = pygame.time.Clock()		
+		self.bindInput()
 				
+	def bindInput(self):
+		#Dispatch tables for the on_* methods, the other events are not queued
+		event_types = [pygame.QUIT]
+		event_types += self.keyboard.bind(self)
+		event_types += self.mouse.bind(self)
+		pygame.event.set_blocked(None)
+		pygame.event.set_allowed(event_types)
+
 	def beforeUpdate(self):
 		self.events = pygame.event.get()
+		if self.events:
+			pos, pressed = pygame.mouse.get_pos(), pygame.mouse.get_pressed()
+		else: #The mouse state only changes with events
+			pos, pressed = self.mouse.screen, self.mouse.pressed
+		self.handleInput(pos, pressed)
+
+	def handleInput(self, pos, pressed):
 		for event in self.events:
 			if event.type == pygame.QUIT:
 				self.loopFlag = False
 		
-		self.keyboard.update(self.events, self)
-		self.mouse.update(self.events, self)        
+		self.keyboard.update(self.events)
+		self.mouse.update(self.events, pos, pressed, self.camera.to_world)
+
+	def updateCamera(self):
+		#Once per frame, the world is only simulated around the view
+		self.camera.update()
+		if hasattr(self.world, 'set_focus'):
+			left, top, right, bottom = self.camera.rect()
+			self.world.set_focus(left, top, right, bottom, self.focus_margin)
 		
 	def afterUpdate(self):
+		if self.profile_font:
+			self.drawProfile()
 		pygame.display.flip()
 		self.clock.tick(self.fps) #Keep framerate stable
 
 	def startLoop(self):
+		if self.remote_physics:
+			return self.remoteLoop()
+		accumulator = 0.0
+		lastTime = pygame.time.get_ticks()
 		while self.loopFlag:
+			stepTime = 1000.0 / self.physics_rate
+			now = pygame.time.get_ticks()
+			accumulator += now - lastTime
+			lastTime = now
 			self.beforeUpdate()
-			self.update()
+			steps = 0
+			while accumulator >= stepTime and steps < self.max_steps:
+				self.update()
+				accumulator -= stepTime
+				steps += 1
+			if steps == self.max_steps:
+				#Too slow to catch up, drop the remaining time
+				accumulator = min(accumulator, stepTime)
+			if self.interpolate:
+				self.alpha = accumulator / stepTime
+			if self.recorder:
+				self.recorder.frame(steps, self.alpha, self.mouse.screen,
+					self.mouse.pressed, self.events)
+			self.updateCamera()
 			self.draw()
 			self.afterUpdate()
+		if self.recorder:
+			self.recorder.close()
+
+	def on_KEY_F3(self):
+		#Toggle the World.step profile overlay
+		if not hasattr(self.world, 'profile'):
+			return #The remote world is profiled in its own process
+		if self.profile_font:
+			self.world.profile(False)
+			self.profile_font = None
+		else:
+			self.world.profile()
+			self.profile_font = pygame.font.Font(None, 18)
+
+	def drawProfile(self):
+		#One text per column, the font is not monospaced
+		y = 4
+		for line in self.world.profiler.report():
+			for x, column in zip((4, 220, 270, 320, 360), line.split()):
+				text = self.profile_font.render(column, True, THECOLORS['white'])
+				self.display.blit(text, (x, y))
+			y += text.get_height()
+
+	def remoteLoop(self):
+		""" The worker steps the world, the frames only draw it """
+		steps = self.world.steps.value
+		try:
+			while self.loopFlag:
+				with self.world.latest():
+					self.beforeUpdate()
+					if self.recorder:
+						#The steps the worker ran since the last frame
+						last, steps = steps, self.world.steps.value
+						self.recorder.frame(min(steps - last, 255), 1,
+							self.mouse.screen, self.mouse.pressed, self.events)
+					self.updateCamera()
+					self.draw()
+				self.afterUpdate()
+		finally:
+			self.world.close()
+			if self.recorder:
+				self.recorder.close()
+
+	def record(self, filename):
+		""" Log the input of each frame of startLoop to filename """
+		self.recorder = InputRecorder(filename, self.physics_rate)
+
+	def replay(self, filename):
+		"""
+		Run the frames of an input log as fast as possible, without
+		waiting for the clock. Returns the number of frames run.
+		"""
+		log = InputReplay(filename)
+		self.physics_rate = log.physics_rate
+		frames = 0
+		for steps, alpha, pos, pressed, events in log:
+			self.events = events
+			self.handleInput(pos, pressed)
+			for i in range(steps):
+				self.update()
+			self.alpha = alpha
+			self.updateCamera()
+			self.draw()
+			frames += 1
+			if not self.loopFlag:
+				break
+		return frames
 			
 	def update(self):
 		pass
@@ -75,8 +217,9 @@ class Mouse:
 	"""One more self-explicative singleton. Update each frame!
 	"""
 	def __init__(self):
-		self.x = 0
+		self.x = 0 #In the world, see screen for the display position
 		self.y = 0
+		self.screen = (0, 0)
 		self.xPrev = 0
 		self.yPrev = 0
 		self.point = Point(0, 0)
@@ -87,17 +230,29 @@ class Mouse:
 		
 		self.wheel = 0
 		self.last_pressed = [0,0,0]
+		self.handlers = {}
+
+	def bind(self, caller):
+		"""Find the caller mouse handlers, returns the event types handled"""
+		self.handlers = {}
+		for event_type, name in ((pygame.MOUSEBUTTONDOWN, "on_MOUSEBUTTONDOWN"),
+				(pygame.MOUSEBUTTONUP, "on_MOUSEBUTTONUP"),
+				(pygame.MOUSEMOTION, "on_MOUSEMOTION")):
+			if hasattr(caller, name):
+				self.handlers[event_type] = getattr(caller, name)
+		return list(self.handlers)
 	
-	def update(self, events, caller):
+	def update(self, events, pos, pressed, to_world=None):
 		#Remember the now old state
 		self.xPrev, self.yPrev = self.x, self.y
 		self.pressedPrev = self.pressed
 		self.wheel = 0
 		
 		#Update state
-		self.x, self.y = pygame.mouse.get_pos()
+		self.screen = pos
+		self.x, self.y = to_world(*pos) if to_world else pos
 		self.point.x, self.point.y = self.x, self.y
-		self.pressed = pygame.mouse.get_pressed()
+		self.pressed = pressed
 		
 		#Remember for how many frames the mouse has been pressed
 		if self.pressed[0] or self.pressed[2]:
@@ -105,26 +260,47 @@ class Mouse:
 		else:
 			self.pressedTime = 0
 		
-		#Handle mouse wheel
-		for event in events:
-			if event.type == pygame.MOUSEBUTTONDOWN:
+		handlers = self.handlers
+		last = len(events) - 1
+		for i, event in enumerate(events):
+			event_type = event.type
+			if event_type == pygame.MOUSEMOTION:
+				#The handlers see the mouse state of the frame, a burst of
+				#motion events only needs the last one
+				if i < last and events[i+1].type == pygame.MOUSEMOTION:
+					continue
+			elif event_type == pygame.MOUSEBUTTONDOWN:
 				self.last_pressed = self.pressed
-				caller.on_MOUSEBUTTONDOWN(self)
-			if event.type == pygame.MOUSEMOTION	and hasattr(caller,"on_MOUSEMOTION"):
-				caller.on_MOUSEMOTION(self)
-			if event.type == pygame.MOUSEBUTTONUP and hasattr(caller,"on_MOUSEBUTTONUP"):
-				caller.on_MOUSEBUTTONUP(self)
+			handler = handlers.get(event_type)
+			if handler:
+				handler(self)
+
+def key_code(symbol):
+	"""The pygame key of the on_KEY_<symbol> handlers"""
+	for name in ("K_"+symbol, "K_"+symbol.upper()):
+		if hasattr(pygame, name):
+			return getattr(pygame, name)
+	if len(symbol) == 1:
+		return ord(symbol)
 
 class Keyboard():
-	def update(self, events, caller):
+	def __init__(self):
+		self.handlers = {}
+
+	def bind(self, caller):
+		"""Map the keys to the caller on_KEY_* methods"""
+		self.handlers = {}
+		for name in dir(caller):
+			if name.startswith("on_KEY_"):
+				key = key_code(name[len("on_KEY_"):])
+				if key is not None:
+					self.handlers[key] = getattr(caller, name)
+		return self.handlers and [pygame.KEYDOWN] or []
+
+	def update(self, events):
+		handlers = self.handlers
 		for event in events:
 			if event.type == pygame.KEYDOWN:
-				try:
-					in_key_map = {pygame.K_SPACE : "space"}
-					key_symbol = in_key_map.get(event.key, chr(event.key)) 
-					key_str = "on_KEY_"+key_symbol			
-				except ValueError:
-					key_str = ""
-				if hasattr(caller, key_str):
-					method = getattr(caller, key_str)
-					method()
+				handler = handlers.get(event.key)
+				if handler:
+					handler()
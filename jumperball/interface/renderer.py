@@ -0,0 +1,108 @@
+import pygame
+from pygame.color import THECOLORS
+
+class LayeredRenderer:
+	"""Draws the part of the world seen by a camera in layers:
+	lines - rasterized on a cached surface with the static shapes, for a
+	        region a padding larger than the view, redrawn when the view
+	        leaves the region or the lines or statics version changes
+	balls - one pre-rendered sprite per radius and colour, all drawn with
+	        a single Surface.blits call, only the ones in the view
+	polygons - drawn every frame, there are only a few of them
+	overlay - lines which are still being edited, drawn every frame
+	"""
+	def __init__(self, display, background='black', line_color='yellow',
+			ball_color='red', polygon_color='orange', static_color='gray',
+		overlay_color='green', padding=200):
+		self.display = display
+		self.background = THECOLORS[background]
+		self.line_color = THECOLORS[line_color]
+		self.ball_color = THECOLORS[ball_color]
+		self.polygon_color = THECOLORS[polygon_color]
+		self.static_color = THECOLORS[static_color]
+		self.overlay_color = THECOLORS[overlay_color]
+		self.padding = padding
+		self.line_layer = None
+		self.line_key = None #(lines, version, statics version) on line_layer
+		self.line_origin = None #World position of the line_layer corner
+		self.sprites = {} #(radius, colour) -> ball surface
+		self.blit_list = [] #Reused (sprite, position) pairs
+
+	def lines_surface(self, world, left, top):
+		"""The line layer covering the view at left, top and its origin"""
+		width, height = self.display.get_size()
+		key = (id(world.lines), world.lines.version, world.static_version)
+		if self.line_layer is None:
+			#The padding is only useful where the world is larger than the view
+			pad = self.padding
+			self.line_layer = pygame.Surface((min(width + 2*pad,
+				max(width, int(world.width))), min(height + 2*pad,
+				max(height, int(world.height))))).convert()
+		layer = self.line_layer
+		layer_width, layer_height = layer.get_size()
+		origin = self.line_origin
+		if key != self.line_key or origin is None or not (
+				origin[0] <= left and left + width <= origin[0] + layer_width and
+				origin[1] <= top and top + height <= origin[1] + layer_height):
+			#Center the region on the view, inside the world
+			x = max(0, min(left - (layer_width - width) // 2,
+				int(world.width) - layer_width))
+			y = max(0, min(top - (layer_height - height) // 2,
+				int(world.height) - layer_height))
+			right, bottom = x + layer_width, y + layer_height
+			layer.fill(self.background)
+			for line in world.lines.query_box(x, y, right, bottom):
+				pygame.draw.line(layer, self.line_color,
+					(int(line.A.x) - x, int(line.A.y) - y),
+					(int(line.B.x) - x, int(line.B.y) - y))
+			for shape in world.static_shapes.query_box(x, y, right, bottom):
+				sx, sy = shape.pos()
+				pygame.draw.circle(layer, self.static_color, (sx - x, sy - y),
+					int(shape.radius))
+			self.line_key = key
+			self.line_origin = origin = x, y
+		return layer, origin
+
+	def sprite(self, radius, color):
+		sprite = self.sprites.get((radius, color))
+		if sprite is None:
+			sprite = pygame.Surface((radius*2, radius*2), pygame.SRCALPHA)
+			pygame.draw.circle(sprite, color, (radius, radius), radius)
+			sprite = self.sprites[(radius, color)] = sprite.convert_alpha()
+		return sprite
+
+	def draw(self, world, alpha=1, overlay=(), camera=None):
+		display = self.display
+		width, height = display.get_size()
+		left, top = camera.rect()[:2] if camera else (0, 0)
+		#The line layer also clears the previous frame
+		layer, (x, y) = self.lines_surface(world, left, top)
+		display.blit(layer, (x - left, y - top))
+
+		shapes = world.shapes_in(left, top, left + width, top + height)
+		blit_list = self.blit_list
+		del blit_list[:]
+		color = self.ball_color
+		polygons = []
+		for shape in shapes:
+			if shape.polygon:
+				polygons.append(shape)
+				continue
+			radius = int(shape.radius)
+			x, y = shape.pos(alpha)
+			blit_list.append((self.sprite(radius, color),
+				(x - radius - left, y - radius - top)))
+		if hasattr(display, 'blits'):
+			display.blits(blit_list, False)
+		else: #pygame older than 1.9.4
+			for sprite, position in blit_list:
+				display.blit(sprite, position)
+
+		for shape in polygons:
+			pygame.draw.polygon(display, self.polygon_color,
+				[(x - left, y - top) for x, y in shape.vertices(alpha)])
+
+		for line in overlay:
+			pygame.draw.line(display, self.overlay_color,
+				(int(line.A.x) - left, int(line.A.y) - top),
+				(int(line.B.x) - left, int(line.B.y) - top))
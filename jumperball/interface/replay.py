@@ -0,0 +1,63 @@
+"""
+Input logs for GraphichalEngine.
+
+A log is a header followed by one record per frame, with the physics steps
+run on that frame, the interpolation alpha, the mouse state and the
+events given to the Keyboard and Mouse. Replaying a log runs the exact
+same steps and inputs, whatever the speed of the machine.
+"""
+import struct
+import pygame
+
+MAGIC = b'JBIN'
+VERSION = 1
+HEADER = struct.Struct('<4sBH') # magic, version, physics rate
+FRAME = struct.Struct('<BHhhBf') # steps, events, mouse x, y, buttons, alpha
+EVENT = struct.Struct('<Hi') # type, key
+
+# events which change the game, the others are not logged
+LOGGED_EVENTS = (pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN,
+	pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION)
+
+class LoggedEvent:
+	""" Stands for the pygame event on replay """
+	def __init__(self, type, key):
+		self.type = type
+		self.key = key
+
+class InputRecorder:
+	def __init__(self, filename, physics_rate):
+		self.log = open(filename, 'wb')
+		self.log.write(HEADER.pack(MAGIC, VERSION, physics_rate))
+
+	def frame(self, steps, alpha, pos, pressed, events):
+		events = [event for event in events if event.type in LOGGED_EVENTS]
+		buttons = pressed[0] | pressed[1] << 1 | pressed[2] << 2
+		self.log.write(FRAME.pack(steps, len(events), pos[0], pos[1],
+			buttons, alpha))
+		for event in events:
+			self.log.write(EVENT.pack(event.type, getattr(event, 'key', 0)))
+
+	def close(self):
+		self.log.close()
+
+class InputReplay:
+	def __init__(self, filename):
+		with open(filename, 'rb') as log:
+			self.data = log.read()
+		magic, version, self.physics_rate = HEADER.unpack_from(self.data)
+		if magic != MAGIC or version != VERSION:
+			raise ValueError("%s is not an input log" % filename)
+
+	def __iter__(self):
+		""" Yields (steps, alpha, pos, pressed, events) for each frame """
+		data, offset = self.data, HEADER.size
+		while offset < len(data):
+			steps, count, x, y, buttons, alpha = FRAME.unpack_from(data, offset)
+			offset += FRAME.size
+			events = []
+			for i in range(count):
+				events.append(LoggedEvent(*EVENT.unpack_from(data, offset)))
+				offset += EVENT.size
+			pressed = (buttons & 1, buttons >> 1 & 1, buttons >> 2 & 1)
+			yield steps, alpha, (x, y), pressed, events
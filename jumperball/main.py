@@ -1,12 +1,15 @@
-import os
+import sys
 from os.path import exists
+from timeit import default_timer as timer
+from argparse import ArgumentParser
 from interface.graphical import GraphichalEngine
+from interface.renderer import LayeredRenderer
 from simulation.geometry import *
 from simulation.shapes import *
 from simulation.world import *
-
-import pygame
-from pygame.color import THECOLORS
+from simulation.level import read_lines, LevelFile
+from simulation.rewind import RewindBuffer
+from simulation.simplify import merge_line, simplify
 
 try:
 	import android	
@@ -16,28 +19,29 @@ except ImportError:
 	
 # Graphichal Engine
 class JumperBall(GraphichalEngine):	
-	lines_xml = 'lines.xml'
+	lines_xml = 'lines.xml' # text level, imported when there is no binary one
+	lines_level = 'lines.level'
 	def init(self):
 		if not ANDROID:
 			self.world.gravity = Vector(0, 0.2)
 		self.drawing_line = Line(None, None)
-		self.load_lines_from_xml()
+		self.renderer = LayeredRenderer(self.display)
+		self.level = LevelFile(self.lines_level)
+		self.load_lines()
+		self.history = RewindBuffer(self.world, 10, self.physics_rate)
 		brokenball = CircleShape(Point(121, 147), 10)
-		self.world.add(brokenball)		
+		#ArrayWorld and RemoteWorld return the handle of the moving shape
+		brokenball = self.world.add(brokenball) or brokenball
+		self.camera.follow(brokenball)
 		if ANDROID:
 			start_ball = CircularBody(Point((100, 100)), 10)
 			self.world.bodies.append(start_ball)
 		
-	def load_lines_from_xml(self):
-		try:
-			with open(self.lines_xml) as xml_file:
-				lines = xml_file.read().splitlines()
-		except IOError:
-			return
-		for line in lines:
-			x1, y1, x2, y2 = line.split()
-			l = Line(Point(int(x1), int(y1)), Point(int(x2), int(y2)))
-			self.world.lines.append(l)
+	def load_lines(self):
+		if exists(self.lines_level):
+			self.level.load(self.world.lines)
+		elif exists(self.lines_xml):
+			self.world.lines.extend(read_lines(self.lines_xml))
 		
 	def update(self):
 		if ANDROID:
@@ -45,22 +49,20 @@ class JumperBall(GraphichalEngine):
 			self.world.y_gravity = x/10
 			self.world.x_gravity = y/10
 		self.world.step()
+		self.history.record()
 			
 	def draw(self):
-		self.display.fill(THECOLORS['black'])
-		for shape in self.world.circle_shapes:
-			pygame.draw.circle(self.display, THECOLORS['red'], shape.center().pos(), shape.radius)
-		#for line in self.world.lines:		
-		#	pygame.draw.line(self.display, THECOLORS['yellow'], line.A.pos(), line.B.pos())
+		overlay = ()
 		if self.drawing_line.A and self.drawing_line.B:
-			line = self.drawing_line
-			pygame.draw.line(self.display, THECOLORS['green'], line.A.pos(), line.B.pos())
+			overlay = (self.drawing_line,)
+		self.renderer.draw(self.world, self.alpha, overlay, self.camera)
 
 	def on_MOUSEBUTTONDOWN(self, mouse):
 		to_delete = [shape for shape in self.world.circle_shapes if shape.hit(mouse.point)]
 		if not to_delete and mouse.pressed[-1]:
 			b = CircleShape(mouse.point, 10)
-			self.world.add(b)
+			b.continuous = True
+			self.camera.follow(self.world.add(b) or b)
 		elif mouse.pressed[0]:
 			self.drawing_line.A = Point(mouse.x, mouse.y)
 			self.drawing_line.B = None
@@ -74,35 +76,79 @@ class JumperBall(GraphichalEngine):
 	def on_MOUSEBUTTONUP(self, mouse):
 		if self.drawing_line.A and self.drawing_line.B:
 			self.world.lines.append(self.drawing_line)
+			merge_line(self.world.lines, self.drawing_line)
 			self.drawing_line = Line(None, None)
 		elif not self.drawing_line.B and mouse.last_pressed[0]:
-			to_delete = []
-			for line in self.world.lines:				
-				MouseCircle = CirculeShape(mouse.point, 3)
-				contact_point = line.contact_point(MouseCircle)
-				if contact_point:
-					to_delete.append(line)
-			for line in to_delete:
-				self.world.lines.remove(line)	
+			for line in self.world.lines.query_point(mouse.point, 3):
+				self.world.lines.remove(line)
 
 	def on_KEY_s(self):
-		new_fn = self.lines_xml+'.new'
-		with open(new_fn, 'a') as lines_file:
-			for line in self.world.lines:
-				lines_file.write("%s %s %s %s\n" \
-					% (line.A.x, line.A.y, line.B.x, line.B.y))
-		if exists(self.lines_xml):
-			os.unlink(self.lines_xml)
-		os.rename(new_fn, self.lines_xml)
+		removed = simplify(self.world.lines)
+		self.level.save(self.world.lines)
+		sys.stdout.write("saved %d lines, %d merged or dropped\n"
+			% (len(self.world.lines), removed))
+
+	def on_KEY_b(self):
+		# drop a box at the mouse
+		if self.remote_physics:
+			sys.stdout.write("boxes are not simulated with --remote\n")
+			return
+		self.world.add(RectangleShape(Point(self.mouse.x, self.mouse.y), 40, 20))
+
+	def on_KEY_p(self):
+		# a static peg at the mouse
+		self.world.add(CircleShape(Point(self.mouse.x, self.mouse.y), 6), True)
+
+	# arrow keys pan the view, a new ball is followed again
+	def on_KEY_LEFT(self):
+		self.camera.move(-self.camera.width / 2, 0)
+
+	def on_KEY_RIGHT(self):
+		self.camera.move(self.camera.width / 2, 0)
+
+	def on_KEY_UP(self):
+		self.camera.move(0, -self.camera.height / 2)
+
+	def on_KEY_DOWN(self):
+		self.camera.move(0, self.camera.height / 2)
+
+	def on_KEY_r(self):
+		# back one second
+		self.history.rewind(self.physics_rate)
 
 	def on_KEY_c(self):
-		self.world.lines = []
+		self.world.lines.clear()
 		self.world.bodies = []
 
 	def on_KEY_space(self):
 		for body in self.world.bodies:
 			body.py = body.y + 5
 
-g = JumperBall()
+parser = ArgumentParser()
+parser.add_argument('--record', metavar='LOG', help="log the input to LOG")
+parser.add_argument('--replay', metavar='LOG',
+	help="run the input from LOG headless and report the time")
+parser.add_argument('--remote', action='store_true',
+	help="step the physics in a separate process")
+parser.add_argument('--world', metavar='WIDTHxHEIGHT',
+	help="world size, larger than the display it scrolls")
+options = parser.parse_args()
+if options.replay and options.remote:
+	# the rewind history needs the world snapshots, which stay in the worker
+	parser.error("--replay runs the physics locally, it can not be --remote")
+JumperBall.remote_physics = options.remote
+if options.world:
+	JumperBall.world_size = tuple(int(n) for n in options.world.split('x'))
+
+g = JumperBall(headless=bool(options.replay))
 g.init()
-g.startLoop()
+if options.replay:
+	start = timer()
+	frames = g.replay(options.replay)
+	elapsed = timer() - start
+	sys.stdout.write("%d frames in %.3fs, %.1f frames/s\n"
+		% (frames, elapsed, frames / elapsed))
+else:
+	if options.record:
+		g.record(options.record)
+	g.startLoop()
@@ -0,0 +1,386 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module provides a NumPy backend for the World:
+
+  ArrayWorld
+    A World which keeps the circles state in contiguous float arrays
+    (structure of arrays) instead of one python object per shape. The
+    integration, gravity, friction and border phases run as whole array
+    operations. The cached circle pairs are split in batches where no
+    shape appears twice, each batch is resolved with array operations.
+    The pairs are not solved in the World.collide order, so the results
+    are close to World but not the same. Lines, static shapes and the
+    sweep go through the regular World code, one handle at a time.
+    Awake shapes are kept at the start of the arrays, in the order of
+    awake_shapes, so the array operations skip the sleeping shapes.
+
+    Reading or writing a handle attribute costs a NumPy scalar access,
+    several times the cost of a CircleShape attribute: the phases which
+    walk the shapes one by one (lines, sweep, sleep) are slower than in
+    World, and the contact pairs are more expensive to build.
+
+  ShapeHandle
+    The object returned by ArrayWorld.add, it behaves like a CircleShape
+    (x, y, px, py, ax, ay, radius, center(), hit(), pos(), ...) but reads
+    and writes the world arrays.
+"""
+import numpy
+from itertools import repeat
+from simulation.geometry import Point
+from simulation.shapes import CircleShape
+from simulation.world import World, SNAPSHOT_FIELDS
+
+# rows of ArrayWorld.state, the first ones are in the snapshot order
+X, Y, PX, PY, AX, AY, RADIUS, LX, LY = range(9)
+FIELDS = SNAPSHOT_FIELDS + ('lx', 'ly')
+
+def _field(row):
+	def get(self):
+		return self.world.state.item(row, self.index)
+	def set(self, value):
+		self.world.state[row, self.index] = value
+	return property(get, set)
+
+class ShapeHandle(object):
+	""" Circle stored at position index of the world arrays """
+	__slots__ = ('world', 'index', 'sleeping', 'idle', 'island', 'continuous',
+		'uid')
+	polygon = False
+
+	x, y = _field(X), _field(Y)
+	px, py = _field(PX), _field(PY)
+	ax, ay = _field(AX), _field(AY)
+	radius = _field(RADIUS)
+	lx, ly = _field(LX), _field(LY)
+
+	def __init__(self, world, index):
+		self.world, self.index = world, index
+		self.sleeping, self.idle, self.island = False, 0, None
+		self.continuous = False
+		self.uid = -1
+
+	def center(self):
+		return Point(self.x, self.y)
+
+	def distance2(self, x, y):
+		dx, dy = self.x-x, self.y-y
+		return dx*dx + dy*dy
+
+	def hit_xy(self, x, y):
+		return self.distance2(x, y) < self.radius*self.radius
+
+	def hit(self, P):
+		return self.hit_xy(P.x, P.y)
+
+	def pos(self, alpha=1):
+		lx, ly = self.lx, self.ly
+		return (int(lx + (self.x-lx)*alpha), int(ly + (self.y-ly)*alpha))
+
+class ArrayWorld(World):
+	def __init__(self, width, height, broadphase=None, capacity=64):
+		World.__init__(self, width, height, broadphase)
+		self.count = 0
+		self.awake = 0 # shapes [0, awake) are awake
+		self._allocate(capacity)
+		self.contact_arrays = None # awake x, y when the pairs were cached
+		self.batch_pairs = None # contact_pairs split in batches
+		self.batches = []
+
+	def _allocate(self, capacity):
+		""" (Re)allocate the state arrays keeping the current shapes """
+		state = numpy.zeros((len(FIELDS), capacity))
+		if self.count:
+			state[:, :self.count] = self.state[:, :self.count]
+		self.state = state
+		# one contiguous row per field, also used by the handles
+		for row, name in enumerate(FIELDS):
+			setattr(self, name, state[row])
+
+	def views(self, *names):
+		""" Views over the awake part of the given rows """
+		awake = self.awake
+		return [getattr(self, name)[:awake] for name in names]
+
+	def swap(self, index1, index2):
+		""" Exchange the position of two shapes in the arrays """
+		if index1 == index2:
+			return
+		state, shapes = self.state, self.circle_shapes
+		state[:, [index1, index2]] = state[:, [index2, index1]]
+		shapes[index1], shapes[index2] = shapes[index2], shapes[index1]
+		shapes[index1].index, shapes[index2].index = index1, index2
+
+	def add(self, shape, static=False):
+		""" Add a shape to the world, returns its handle """
+		if static: # the static shapes are not stored in the arrays
+			World.add(self, shape, static)
+			return shape
+		if shape.polygon:
+			raise TypeError("ArrayWorld only stores circles")
+		if self.count == self.state.shape[1]:
+			self._allocate(self.count * 2)
+		index = self.count
+		for name in FIELDS:
+			getattr(self, name)[index] = getattr(shape, name)
+		self.count += 1
+		handle = ShapeHandle(self, index)
+		handle.continuous = getattr(shape, 'continuous', False)
+		handle.uid = self.next_uid
+		self.next_uid += 1
+		self.circle_shapes.append(handle)
+		self.forget_contacts()
+		self.swap(index, self.awake)
+		self.awake_shapes.append(handle)
+		self.awake += 1
+		return handle
+
+	def remove(self, handle):
+		""" Remove a shape, the last shapes are moved to its place """
+		if handle in self.static_shapes:
+			return World.remove(self, handle)
+		self.wake(handle)
+		self.forget_contacts()
+		# the awake shapes are in index order, swap the last one in
+		awake_shapes = self.awake_shapes
+		self.awake -= 1
+		awake_shapes[handle.index] = awake_shapes[self.awake]
+		awake_shapes.pop()
+		last = self.count - 1
+		self.swap(handle.index, self.awake)
+		self.swap(self.awake, last)
+		self.circle_shapes.pop()
+		self.count = last
+		handle.world, handle.index = None, -1
+
+	def sleep(self, island):
+		World.sleep(self, island)
+		for handle in island:
+			self.awake -= 1
+			self.swap(handle.index, self.awake)
+		self.awake_shapes = self.circle_shapes[:self.awake]
+
+	def wake(self, handle):
+		if not handle.sleeping:
+			return
+		island = handle.island
+		World.wake(self, handle)
+		for handle in island:
+			self.swap(handle.index, self.awake)
+			self.awake += 1
+
+	def contact_candidates(self):
+		""" World.contact_candidates, with the cache checked on the arrays """
+		x, y = self.views('x', 'y')
+		cached = self.contact_arrays
+		if self.contact_shapes is self.awake_shapes and cached is not None \
+				and len(cached[0]) == self.awake:
+			limit = self.contact_margin * self.contact_margin / 4
+			if not self.awake or ((x - cached[0])**2 +
+					(y - cached[1])**2).max() <= limit:
+				self.contact_hits += 1
+				return self.contact_pairs
+		self.contact_shapes = None
+		pairs = World.contact_candidates(self)
+		self.contact_arrays = x.copy(), y.copy()
+		return pairs
+
+	def close_pairs(self, circles, margin):
+		candidates = list(self.broadphase.pairs(circles, margin))
+		if not candidates:
+			return []
+		first = numpy.array([pair[0].index for pair in candidates])
+		second = numpy.array([pair[1].index for pair in candidates])
+		x, y, radius = self.x, self.y, self.radius
+		dx, dy = x[first] - x[second], y[first] - y[second]
+		target = radius[first] + radius[second] + margin
+		close = numpy.flatnonzero(dx*dx + dy*dy < target*target)
+		return [candidates[index] for index in close.tolist()]
+
+	def pair_batches(self, pairs):
+		"""
+		Split pairs in batches of (first, second, pairs) with no shape
+		twice, each pair goes to the first batch its shapes are not in.
+		"""
+		used = [0] * self.count # bit mask of the batches of each shape
+		batches = []
+		for pair in pairs:
+			index1, index2 = pair[0].index, pair[1].index
+			taken = used[index1] | used[index2]
+			free = ~taken & (taken + 1) # lowest clear bit
+			batch = free.bit_length() - 1
+			used[index1] |= free
+			used[index2] |= free
+			if batch == len(batches):
+				batches.append(([], [], []))
+			first, second, batch_pairs = batches[batch]
+			first.append(index1)
+			second.append(index2)
+			batch_pairs.append(pair)
+		return [(numpy.array(first), numpy.array(second), batch_pairs)
+			for first, second, batch_pairs in batches]
+
+	def collide(self, preserve_impulse):
+		""" World.collide, the circle pairs are resolved batch by batch """
+		pairs = self.contact_candidates()
+		if pairs is not self.batch_pairs:
+			self.batch_pairs = pairs
+			self.batches = self.pair_batches(pairs)
+		overlap = 0
+		for batch in self.batches:
+			overlap = max(overlap, self.collide_batch(batch, preserve_impulse))
+		if self.sleeping_shapes:
+			# waking shapes only moves sleeping shapes in the arrays
+			woken = list(self.sleeping_pairs([]))
+			for batch in self.pair_batches(woken):
+				overlap = max(overlap, self.collide_batch(batch, preserve_impulse))
+		if self.static_shapes:
+			overlap = max(overlap, self.collide_static(preserve_impulse))
+		return overlap
+
+	def collide_batch(self, batch, preserve_impulse):
+		""" The circle pairs of one batch, returns the biggest overlap """
+		first, second, pairs = batch
+		x, y, px, py = self.x, self.y, self.px, self.py
+		dx, dy = x[first] - x[second], y[first] - y[second]
+		slength = dx*dx + dy*dy
+		length = numpy.sqrt(slength)
+		target = self.radius[first] + self.radius[second]
+		hit = (length < target) & (slength > 0)
+		if not hit.any():
+			return 0
+		hits = numpy.flatnonzero(hit)
+		first, second = first[hits], second[hits]
+		dx, dy, slength = dx[hits], dy[hits], slength[hits]
+		length, target = length[hits], target[hits]
+		if self.sleep_steps:
+			join_islands = self.join_islands
+			for index in hits:
+				join_islands(*pairs[index])
+
+		# record previous velocity
+		v1x, v1y = x[first] - px[first], y[first] - py[first]
+		v2x, v2y = x[second] - px[second], y[second] - py[second]
+
+		# resolve the overlaps, no shape is twice in a batch
+		factor = (length - target) / length
+		x[first] -= dx*factor*0.5
+		y[first] -= dy*factor*0.5
+		x[second] += dx*factor*0.5
+		y[second] += dy*factor*0.5
+
+		if preserve_impulse:
+			# swap the projected components, as in World.collide
+			f1 = (self.damping*(dx*v1x + dy*v1y)) / slength
+			f2 = (self.damping*(dx*v2x + dy*v2y)) / slength
+			v1x += f2*dx - f1*dx
+			v2x += f1*dx - f2*dx
+			v1y += f2*dy - f1*dy
+			v2y += f1*dy - f2*dy
+			px[first], py[first] = x[first] - v1x, y[first] - v1y
+			px[second], py[second] = x[second] - v2x, y[second] - v2y
+
+			contacts = self.contacts
+			if contacts is not None:
+				radius = self.radius[first] / length
+				for values in zip((pairs[index][0].uid for index in hits),
+						(pairs[index][1].uid for index in hits), repeat(-1),
+						(x[first] - dx*radius).tolist(),
+						(y[first] - dy*radius).tolist(),
+						(abs(f2 - f1) * length).tolist()):
+					contacts.add(*values)
+		return float((target - length).max())
+
+	def shape(self, handle):
+		""" Returns a standalone CircleShape copy of handle """
+		shape = CircleShape(Point(handle.x, handle.y), handle.radius)
+		shape.px, shape.py = handle.px, handle.py
+		shape.ax, shape.ay = handle.ax, handle.ay
+		return shape
+
+	def snapshot_shapes(self, buffer, start):
+		# the buffer is written through a view, shape by shape rows
+		rows = numpy.frombuffer(buffer, dtype=numpy.float64)[start:]
+		rows.shape = (self.count, len(SNAPSHOT_FIELDS))
+		rows[:] = self.state[:len(SNAPSHOT_FIELDS), :self.count].T
+
+	def restore_shapes(self, buffer, start):
+		rows = numpy.frombuffer(buffer, dtype=numpy.float64)[start:]
+		rows.shape = (self.count, len(SNAPSHOT_FIELDS))
+		self.state[:len(SNAPSHOT_FIELDS), :self.count] = rows.T
+		self.state[LX, :self.count] = self.state[X, :self.count]
+		self.state[LY, :self.count] = self.state[Y, :self.count]
+
+	def store_positions(self):
+		x, y, lx, ly = self.views('x', 'y', 'lx', 'ly')
+		lx[:] = x
+		ly[:] = y
+
+	def border_collide_preserve_impulse(self):
+		x, y, px, py, radius = self.views('x', 'y', 'px', 'py', 'radius')
+		damping = self.damping
+		for pos, prev, limit in ((x, px, self.width), (y, py, self.height)):
+			low = pos - radius < 0
+			high = ~low & (pos + radius > limit)
+			for mask, value in ((low, radius[low]), (high, limit - radius[high])):
+				velocity = (prev[mask] - pos[mask]) * damping
+				pos[mask] = value
+				prev[mask] = value - velocity
+
+	def border_collide(self):
+		x, y, radius = self.views('x', 'y', 'radius')
+		for pos, limit in ((x, self.width), (y, self.height)):
+			low = pos - radius < 0
+			high = ~low & (pos + radius > limit)
+			pos[low] = radius[low]
+			pos[high] = limit - radius[high]
+
+	def apply_gravity(self):
+		ax, ay = self.views('ax', 'ay')
+		ay += self.gravity.y
+		ax += self.gravity.x
+
+	def apply_friction(self):
+		x, y, px, py, ax, ay = self.views('x', 'y', 'px', 'py', 'ax', 'ay')
+		dx, dy = px - x, py - y
+		length = numpy.hypot(dx, dy)
+		for pos, prev, acc, delta in ((x, px, ax, dx), (y, py, ay, dy)):
+			moving = delta != 0
+			acc[moving] += delta[moving] / length[moving] * self.friction
+			# stop on residual acceleration
+			rest = moving & (numpy.abs(delta) < 0.04)
+			acc[rest] = 0
+			prev[rest] = pos[rest]
+
+	def inertia(self):
+		x, y, px, py = self.views('x', 'y', 'px', 'py')
+		for pos, prev in ((x, px), (y, py)):
+			new = pos*2 - prev
+			prev[:] = pos
+			pos[:] = new
+
+	def accelerate(self, delta):
+		x, y, ax, ay = self.views('x', 'y', 'ax', 'ay')
+		x += ax * delta * delta
+		# CircleShape.accelerate applies the y acceleration twice
+		y += ay * delta * delta * 2
+		ax[:] = 0
+		ay[:] = 0
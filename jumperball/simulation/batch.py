@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module runs worlds without a display, to tune levels:
+
+  Scenario
+    The world configuration (size, gravity, damping, friction, balls and
+    lines) and for how many steps to run it. Scenarios only hold plain
+    values so they can be sent to other processes.
+
+  run_scenario(scenario)
+    Builds and steps the world, returns a dict of metrics:
+      steps_per_second - simulation speed
+      settle_step - first step where all the balls are stopped, or None
+      escaped - balls which ended outside of the world area
+      cache_hit_rate, solver_iterations - see World.contact_stats
+    With a trajectory filename the positions and velocities of every
+    step are recorded there, see simulation.trajectory.
+
+  run_batch(scenarios, processes=None)
+    Runs the scenarios in a multiprocessing pool, yielding the metrics of
+    each scenario as soon as it is done.
+
+  Usage from the command line, one scenario per gravity/balls combination:
+    python -m simulation.batch --balls 10 100 --gravity 0.1 0.2 \
+      --lines lines.xml --steps 2000 [--trajectories DIRECTORY]
+"""
+import os
+import sys
+from multiprocessing import Pool
+from random import Random
+from timeit import default_timer as timer
+from simulation.geometry import Point, Vector, Line
+from simulation.shapes import CircleShape
+from simulation.world import World
+from simulation.level import read_level
+
+class Scenario:
+	def __init__(self, name='', width=800, height=480, gravity=(0, 0.2),
+			damping=0.90, friction=0, balls=10, radius=10, lines=(),
+			steps=1000, substeps=2, seed=0, trajectory=None):
+		self.name = name
+		self.width, self.height = width, height
+		self.gravity = gravity
+		self.damping = damping
+		self.friction = friction
+		self.balls = balls
+		self.radius = radius
+		self.lines = list(lines) # (x1, y1, x2, y2) tuples
+		self.steps = steps
+		self.substeps = substeps
+		self.seed = seed
+		self.trajectory = trajectory # file to record the steps to
+
+	def __repr__(self):
+		return "<Scenario> %s" % self.name
+
+	def load_lines(self, filename):
+		""" Use the lines from a text or binary level file """
+		self.lines = [(line.A.x, line.A.y, line.B.x, line.B.y)
+			for line in read_level(filename)]
+
+	def build(self):
+		""" Returns the World for this scenario """
+		world = World(self.width, self.height)
+		world.gravity = Vector(*self.gravity)
+		world.damping = self.damping
+		world.friction = self.friction
+		world.substeps = self.substeps
+		world.lines.extend(Line(Point(x1, y1), Point(x2, y2))
+			for x1, y1, x2, y2 in self.lines)
+		random = Random(self.seed)
+		radius = self.radius
+		for i in range(self.balls):
+			x = random.uniform(radius, self.width - radius)
+			y = random.uniform(radius, self.height / 2.0)
+			world.add(CircleShape(Point(x, y), radius))
+		return world
+
+def settled(world):
+	""" True when no ball is moving faster than the sleep velocity """
+	limit = world.sleep_velocity ** 2
+	for shape in world.awake_shapes:
+		vx, vy = shape.x - shape.px, shape.y - shape.py
+		if vx*vx + vy*vy >= limit:
+			return False
+	return True
+
+def run_scenario(scenario):
+	world = scenario.build()
+	if scenario.trajectory:
+		world.record_trajectory(scenario.trajectory, velocity=True)
+	settle_step = None
+	start = timer()
+	for step in range(scenario.steps):
+		world.step()
+		if settle_step is None:
+			if settled(world):
+				settle_step = step
+		elif not settled(world):
+			settle_step = None
+	elapsed = timer() - start
+	world.record_trajectory(None)
+	width, height = world.width, world.height
+	escaped = sum(1 for shape in world.circle_shapes
+		if not (0 <= shape.x <= width and 0 <= shape.y <= height))
+	metrics = world.contact_stats()
+	metrics.update({
+		'name': scenario.name,
+		'steps': scenario.steps,
+		'seconds': elapsed,
+		'steps_per_second': scenario.steps / elapsed if elapsed else None,
+		'settle_step': settle_step,
+		'escaped': escaped,
+		'sleeping': len(world.sleeping_shapes),
+		'trajectory': scenario.trajectory,
+	})
+	return metrics
+
+def run_batch(scenarios, processes=None):
+	""" Yields the metrics of each scenario, in completion order """
+	pool = Pool(processes)
+	try:
+		for result in pool.imap_unordered(run_scenario, scenarios):
+			yield result
+	finally:
+		pool.terminate()
+		pool.join()
+
+def main(args=None):
+	from argparse import ArgumentParser
+	parser = ArgumentParser(description="Run jumperball worlds headless")
+	parser.add_argument('--balls', type=int, nargs='+', default=[10])
+	parser.add_argument('--gravity', type=float, nargs='+', default=[0.2])
+	parser.add_argument('--damping', type=float, nargs='+', default=[0.90])
+	parser.add_argument('--friction', type=float, nargs='+', default=[0])
+	parser.add_argument('--lines', help="level file")
+	parser.add_argument('--steps', type=int, default=1000)
+	parser.add_argument('--processes', type=int)
+	parser.add_argument('--trajectories', metavar='DIRECTORY',
+		help="record the steps of each scenario to a file in DIRECTORY")
+	options = parser.parse_args(args)
+	if options.trajectories and not os.path.isdir(options.trajectories):
+		os.makedirs(options.trajectories)
+	scenarios = []
+	for balls in options.balls:
+		for gravity in options.gravity:
+			for damping in options.damping:
+				for friction in options.friction:
+					name = "balls=%d gravity=%g damping=%g friction=%g" \
+						% (balls, gravity, damping, friction)
+					scenario = Scenario(name, gravity=(0, gravity),
+						damping=damping, friction=friction, balls=balls,
+						steps=options.steps)
+					if options.lines:
+						scenario.load_lines(options.lines)
+					if options.trajectories:
+						scenario.trajectory = os.path.join(options.trajectories,
+							name.replace(' ', '_') + '.traj')
+					scenarios.append(scenario)
+	for result in run_batch(scenarios, options.processes):
+		# None when the steps took no measurable time
+		speed = result['steps_per_second']
+		speed = '%.0f' % speed if speed is not None else '-'
+		sys.stdout.write("%(name)s: %(speed)s steps/s, "
+			"settled at %(settle_step)s, %(escaped)d escaped, "
+			"%(cache_hit_rate).0f%% cached contacts, "
+			"%(solver_iterations).1f solver iterations\n"
+			% dict(result, speed=speed,
+				cache_hit_rate=result['cache_hit_rate']*100))
+		sys.stdout.flush()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,263 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module provides the collision broadphases:
+
+  A broadphase receives the list of shapes and returns the candidate
+  pairs (shape1, shape2) which may be colliding, or which are closer
+  than margin. Only those pairs are passed to the narrowphase (the exact
+  circle test in World.collide).
+
+	BruteForce - every pair, no bookkeeping, best for a handful of shapes
+	UniformGrid - spatial hash of cells as large as the biggest shape
+	SweepAndPrune - sort on the x axis and sweep for overlapping intervals
+
+  box_pairs - pairs of a few shapes (the polygons) with many others, so
+	the big shapes do not grow the cells of the broadphase of the circles
+
+  CircleGrid - index of circles which are not moving, used for queries
+"""
+from bisect import bisect_left, bisect_right
+
+def box_pairs(shapes, others, margin=0):
+	"""
+	Pairs (shape, other) whose bounding circle boxes are closer than
+	margin. The others are sorted on the left side, each shape only looks
+	at the range of others which can reach it.
+	"""
+	if not shapes or not others:
+		return
+	order = sorted(others, key=lambda s: s.x - s.radius)
+	lefts = [s.x - s.radius for s in order]
+	reach = 2*max(s.radius for s in order) + margin
+	for shape in shapes:
+		x, y, radius = shape.x, shape.y, shape.radius
+		first = bisect_left(lefts, x - radius - reach)
+		last = bisect_right(lefts, x + radius + margin)
+		for other in order[first:last]:
+			if other is not shape and \
+					abs(other.y - y) <= radius + other.radius + margin and \
+					abs(other.x - x) <= radius + other.radius + margin:
+				yield shape, other
+
+class SortedBoxes:
+	"""
+	Shapes sorted on the left side of their bounding box, for the box
+	queries of a few shapes among many, eg. the paths of the swept shapes.
+	The shapes which move must be moved in the order with move().
+	"""
+	def __init__(self, shapes):
+		self.shapes = sorted(shapes, key=lambda s: s.x - s.radius)
+		self.lefts = [s.x - s.radius for s in self.shapes]
+		self.reach = 2*max(s.radius for s in self.shapes) if shapes else 0
+
+	def add(self, shape):
+		left = shape.x - shape.radius
+		index = bisect_right(self.lefts, left)
+		self.lefts.insert(index, left)
+		self.shapes.insert(index, shape)
+		self.reach = max(self.reach, 2*shape.radius)
+
+	def move(self, shape, left):
+		""" Sort again shape, whose box left side was left """
+		index = bisect_left(self.lefts, left)
+		while self.shapes[index] is not shape:
+			index += 1
+		del self.lefts[index], self.shapes[index]
+		self.add(shape)
+
+	def query(self, left, right):
+		""" The shapes whose bounding box may overlap left to right """
+		first = bisect_left(self.lefts, left - self.reach)
+		return self.shapes[first:bisect_right(self.lefts, right)]
+
+class BruteForce:
+	""" Returns every pair of shapes """
+	def pairs(self, shapes, margin=0):
+		count = len(shapes)
+		for i in range(count):
+			shape1 = shapes[i]
+			for j in range(i+1, count):
+				yield shape1, shapes[j]
+
+class UniformGrid:
+	""" Spatial hash grid
+	Each shape is stored in the cell containing its center. The cell size
+	is never smaller than the biggest diameter plus the margin, so
+	overlapping shapes are always in the same or in neighbour cells.
+	"""
+	# half of the neighbourhood, the other half is visited from the
+	# neighbour cells, so each pair is only reported once
+	neighbours = ((1, -1), (1, 0), (1, 1), (0, 1))
+
+	def __init__(self, cell_size=0):
+		self.cell_size = cell_size
+		self.cells = {} # kept between calls, so the cell lists are reused
+
+	def pairs(self, shapes, margin=0):
+		if not shapes:
+			return
+		cell_size = max(self.cell_size,
+			2*max(s.radius for s in shapes) + margin)
+		cells = self.cells
+		if len(cells) > 4*len(shapes): # too many stale empty cells
+			cells.clear()
+		for key in cells:
+			del cells[key][:]
+		for shape in shapes:
+			key = (int(shape.x // cell_size), int(shape.y // cell_size))
+			cell = cells.get(key)
+			if cell is None:
+				cells[key] = [shape]
+			else:
+				cell.append(shape)
+		neighbours = self.neighbours
+		for key in cells:
+			cell = cells[key]
+			count = len(cell)
+			if not count:
+				continue
+			for i in range(count):
+				shape1 = cell[i]
+				for j in range(i+1, count):
+					yield shape1, cell[j]
+			cx, cy = key
+			for dx, dy in neighbours:
+				other = cells.get((cx+dx, cy+dy))
+				if not other:
+					continue
+				for shape1 in cell:
+					for shape2 in other:
+						yield shape1, shape2
+
+class SweepAndPrune:
+	""" Sort and sweep on the x axis
+	Shapes are sorted by the left side of their bounding box, each shape
+	is then only checked against the following shapes which start before
+	its right side. The previous order is kept so that the sort works on
+	an almost sorted list from frame to frame.
+	"""
+	def __init__(self):
+		self.order = []
+
+	def pairs(self, shapes, margin=0):
+		order = self.order
+		if len(order) != len(shapes) or set(order) != set(shapes):
+			order = self.order = list(shapes)
+		order.sort(key=lambda s: s.x - s.radius)
+		lefts = [s.x - s.radius for s in order]
+		count = len(order)
+		pairs = []
+		append = pairs.append
+		for i in range(count):
+			shape1 = order[i]
+			x1, y1, radius1 = shape1.x, shape1.y, shape1.radius
+			right = x1 + radius1 + margin
+			j = i + 1
+			while j < count and lefts[j] <= right:
+				shape2 = order[j]
+				if abs(shape2.y - y1) <= radius1 + shape2.radius + margin:
+					append((shape1, shape2))
+				j += 1
+		return pairs
+
+class CircleGrid:
+	""" Grid index for circles which do not move (eg. sleeping shapes)
+	Each circle is stored in every cell overlapped by its bounding box,
+	shapes must be removed before they are moved.
+	"""
+	def __init__(self, cell_size=32):
+		self.cell_size = cell_size
+		self.cells = {}
+		self.shape_cells = {}
+
+	def __len__(self):
+		return len(self.shape_cells)
+
+	def __iter__(self):
+		return iter(self.shape_cells)
+
+	def __contains__(self, shape):
+		return shape in self.shape_cells
+
+	def keys(self, x, y, radius):
+		size = self.cell_size
+		column0, column1 = int((x-radius) // size), int((x+radius) // size)
+		row0, row1 = int((y-radius) // size), int((y+radius) // size)
+		return [(column, row) for column in range(column0, column1+1)
+			for row in range(row0, row1+1)]
+
+	def add(self, shape):
+		keys = self.keys(shape.x, shape.y, shape.radius)
+		cells = self.cells
+		for key in keys:
+			cell = cells.get(key)
+			if cell is None:
+				cells[key] = [shape]
+			else:
+				cell.append(shape)
+		self.shape_cells[shape] = keys
+
+	def remove(self, shape):
+		cells = self.cells
+		for key in self.shape_cells.pop(shape):
+			cell = cells[key]
+			cell.remove(shape)
+			if not cell:
+				del cells[key]
+
+	def query_box(self, left, top, right, bottom):
+		""" Set of the shapes in the cells overlapped by the box """
+		found = set()
+		if not self.shape_cells:
+			return found
+		size, cells = self.cell_size, self.cells
+		column0, column1 = int(left // size), int(right // size)
+		row0, row1 = int(top // size), int(bottom // size)
+		if (column1 - column0 + 1) * (row1 - row0 + 1) > len(cells):
+			# a big box, look at the cells there are instead
+			for (column, row), cell in cells.items():
+				if column0 <= column <= column1 and row0 <= row <= row1:
+					found.update(cell)
+			return found
+		for column in range(column0, column1+1):
+			for row in range(row0, row1+1):
+				cell = cells.get((column, row))
+				if cell:
+					found.update(cell)
+		return found
+
+	def nearby(self, x, y, radius):
+		""" Shapes in the cells overlapped by the circle bounding box """
+		if not self.shape_cells:
+			return []
+		size, cells = self.cell_size, self.cells
+		column0, column1 = int((x-radius) // size), int((x+radius) // size)
+		row0, row1 = int((y-radius) // size), int((y+radius) // size)
+		if column0 == column1 and row0 == row1: # no duplicates in one cell
+			return list(cells.get((column0, row0), ()))
+		found = []
+		for column in range(column0, column1+1):
+			for row in range(row0, row1+1):
+				for shape in cells.get((column, row), ()):
+					if shape not in found:
+						found.append(shape)
+		return found
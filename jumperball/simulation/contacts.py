@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module provides the contact events of a world step:
+
+  ContactBuffer
+    Preallocated columns (array module arrays, one item per contact)
+    which World.step fills with the contacts it resolved with a velocity
+    change, on every step it starts again from the first item:
+
+	first - uid of the shape
+	second - uid of the other shape, -1 for a line
+	line - segment slot of the line (SegmentIndex.slot_line), -1 for a shape
+	x, y - contact point
+	impulse - velocity change along the contact normal
+
+    Only the first count items are valid. Contacts below min_impulse
+    (eg. shapes resting on each other) are skipped, contacts past the
+    capacity are counted in dropped. The columns can be read as arrays,
+    eg. numpy.frombuffer(buffer.impulse)[:buffer.count].
+"""
+from array import array
+from itertools import repeat
+
+INT_FIELDS = ('first', 'second', 'line')
+FLOAT_FIELDS = ('x', 'y', 'impulse')
+
+class ContactBuffer:
+	def __init__(self, capacity=256, min_impulse=0.0):
+		self.capacity = capacity
+		self.min_impulse = min_impulse
+		for name in INT_FIELDS:
+			setattr(self, name, array('i', repeat(0, capacity)))
+		for name in FLOAT_FIELDS:
+			setattr(self, name, array('d', repeat(0.0, capacity)))
+		self.count = 0
+		self.dropped = 0 # contacts of this step which did not fit
+
+	def __len__(self):
+		return self.count
+
+	def __iter__(self):
+		""" (first, second, line, x, y, impulse) of each contact """
+		count = self.count
+		return iter(zip(self.first[:count], self.second[:count],
+			self.line[:count], self.x[:count], self.y[:count],
+			self.impulse[:count]))
+
+	def clear(self):
+		self.count = 0
+		self.dropped = 0
+
+	def add(self, first, second, line, x, y, impulse):
+		if impulse < self.min_impulse:
+			return
+		index = self.count
+		if index == self.capacity:
+			self.dropped += 1
+			return
+		self.first[index], self.second[index], self.line[index] = \
+			first, second, line
+		self.x[index], self.y[index], self.impulse[index] = x, y, impulse
+		self.count = index + 1
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module provides the time of impact tests used for the continuous
+  collision of fast shapes. A moving circle goes from (x, y) to
+  (x+dx, y+dy) during the step, the tests return the fraction t of the
+  motion (0..1) where the first contact happens, or None.
+
+	segment_toi - circle against a segment from the SegmentIndex table
+	circle_toi - circle against another moving circle
+"""
+from math import sqrt
+
+def point_toi(x, y, dx, dy, radius):
+	""" Circle at (x, y) relative to a point, moving by (dx, dy) """
+	a = dx*dx + dy*dy
+	b = 2*(x*dx + y*dy)
+	c = x*x + y*y - radius*radius
+	if c <= 0 or b >= 0: # already in contact or moving away
+		return None
+	discriminant = b*b - 4*a*c
+	if discriminant < 0:
+		return None
+	t = (-b - sqrt(discriminant)) / (2*a)
+	if t > 1:
+		return None
+	return t
+
+def segment_toi(x, y, dx, dy, radius, ox, oy, ex, ey, inverse, nx, ny):
+	"""
+	Returns (t, normal x, normal y) for the circle against the segment
+	starting at (ox, oy) with direction (ex, ey), inverse squared length
+	and unit normal (nx, ny). The normal points to the circle side.
+	"""
+	best = None
+	rx, ry = x - ox, y - oy
+	# the sides of the segment, moved by radius towards the circle
+	distance = rx*nx + ry*ny
+	speed = dx*nx + dy*ny
+	if distance < 0:
+		distance, speed, nx, ny = -distance, -speed, -nx, -ny
+	if distance > radius and speed < 0:
+		t = (distance - radius) / -speed
+		if t <= 1:
+			u = ((rx + dx*t)*ex + (ry + dy*t)*ey) * inverse
+			if 0 <= u <= 1:
+				best = (t, nx, ny)
+	if best is None:
+		# the end points
+		for px, py in ((rx, ry), (rx - ex, ry - ey)):
+			t = point_toi(px, py, dx, dy, radius)
+			if t is not None and (best is None or t < best[0]):
+				cx, cy = px + dx*t, py + dy*t
+				best = (t, cx/radius, cy/radius)
+	return best
+
+def circle_toi(x, y, vx, vy, target):
+	"""
+	Returns t for a circle at relative position (x, y) moving with
+	relative velocity (vx, vy) against another circle, target is the sum
+	of both radius.
+	"""
+	return point_toi(x, y, vx, vy, target)
@@ -26,13 +26,19 @@
 """
 from math import sqrt, hypot, pi, sin, cos, atan2
 
-class Point:
+class Point(object):
+	__slots__ = ('x', 'y')
 
 	def __init__(self, x, y):
 		self.x, self.y = x, y
 			
 	def distance_to(self, other):
 		return hypot(self.x-other.x, self.y-other.y)
+
+	def distance2_to(self, x, y):
+		""" squared distance to (x, y), without building a Point """
+		dx, dy = self.x-x, self.y-y
+		return dx*dx + dy*dy
 		
 	def pos(self):
 		""" return position as tuple, useful for some gfx libs """
@@ -50,10 +56,12 @@ class Point:
 
 class Vector(Point):
 	""" For simplicy we assume vectors have origin (0,0) to (PointX, PointY)"""
-	pass
+	__slots__ = ()
 
-class Line:
+class Line(object):
 	""" Line between point A and B """
+	__slots__ = ('A', 'B')
+
 	def __init__(self, A, B):
 		self.A, self.B = A, B
 			
@@ -79,13 +87,33 @@ class Line:
 		intersection_y = A.y + u * ( B.y - A.y)
 		return Point(intersection_x, intersection_y), in_segement
 	
+	def closest_xy(self, x, y):
+		""" Returns (x, y) of the segment point which is closer to (x, y) """
+		A, B = self.A, self.B
+		dx, dy = B.x - A.x, B.y - A.y
+		length2 = dx*dx + dy*dy
+		if not length2:
+			return A.x, A.y
+		u = ((x - A.x)*dx + (y - A.y)*dy) / float(length2)
+		if u < 0:
+			u = 0
+		elif u > 1:
+			u = 1
+		return A.x + u*dx, A.y + u*dy
+
+	def closest_point(self, C):
+		""" Returns the point from the segment which is closer to point C """
+		return Point(*self.closest_xy(C.x, C.y))
+
+	def touches(self, x, y, radius):
+		""" True if the circle centered at (x, y) touches the segment """
+		cx, cy = self.closest_xy(x, y)
+		return (cx-x)*(cx-x) + (cy-y)*(cy-y) <= radius*radius
+
 	def contact_point(self, C):
 		""" Returns the contact point with a circle """
-		p, in_segement = self.intersection_point(C.center())
-		if not in_segement:
-			p = C.center().nearest(self.A, self.B)
-		distance = p.distance_to(C.center())
-		if distance > C.radius:
+		x, y = self.closest_xy(C.x, C.y)
+		if (x-C.x)*(x-C.x) + (y-C.y)*(y-C.y) > C.radius*C.radius:
 			return None
 		else:
-			return p
+			return Point(x, y)
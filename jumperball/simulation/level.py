@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module provides the level files loading and saving:
+
+  Text levels (lines.xml)
+    One line segment per text line: "x1 y1 x2 y2"
+
+  Binary levels (LevelFile)
+    A header (magic, version, record size) followed by batches. Each batch
+    is its record count and CRC32, then the records. A record adds or
+    removes a segment and holds its end points and the precomputed
+    length and unit normal, which go straight into the SegmentIndex
+    table.
+    Saving appends one batch with the segments added or removed since the
+    last save. A batch which was not completely written fails the
+    checksum and is ignored on load, then overwritten by the next save.
+    When the file holds too many records for the live segments it is
+    compacted, rewritten to a new file which replaces the old one.
+
+  read_level(filename) - the lines of a text or binary level
+"""
+import os
+import struct
+import zlib
+from math import hypot
+from mmap import mmap, ACCESS_READ
+from simulation.geometry import Point, Line
+
+MAGIC = b'JBLV'
+VERSION = 1
+HEADER = struct.Struct('<4sHH') # magic, version, record size
+BATCH = struct.Struct('<II') # records, crc32 of the records
+RECORD = struct.Struct('<B3x4f3d') # op, x1, y1, x2, y2, length, nx, ny
+ADD, REMOVE = 1, 0
+
+def read_lines(filename):
+	""" Returns the list of Line read from a text level file """
+	with open(filename) as level_file:
+		text_lines = level_file.read().splitlines()
+	lines = []
+	for text_line in text_lines:
+		if not text_line.strip():
+			continue
+		x1, y1, x2, y2 = text_line.split()
+		lines.append(Line(Point(int(x1), int(y1)), Point(int(x2), int(y2))))
+	return lines
+
+def line_key(line):
+	return line.A.x, line.A.y, line.B.x, line.B.y
+
+def line_normal(line):
+	""" (length, nx, ny) as compiled by the SegmentIndex """
+	dx, dy = float(line.B.x - line.A.x), float(line.B.y - line.A.y)
+	length = hypot(dx, dy)
+	if not length:
+		return 0.0, 0.0, 0.0
+	return length, -dy / length, dx / length
+
+def is_binary_level(filename):
+	with open(filename, 'rb') as level_file:
+		return level_file.read(len(MAGIC)) == MAGIC
+
+def read_level(filename):
+	""" Returns the list of Line of a binary or text level """
+	if is_binary_level(filename):
+		return [line for line, normal in LevelFile(filename).read()]
+	return read_lines(filename)
+
+def replace(source, destination):
+	""" Rename source to destination, replacing it """
+	try:
+		os.replace(source, destination)
+	except AttributeError: # python 2, rename does not replace on windows
+		if os.name == 'nt' and os.path.exists(destination):
+			os.unlink(destination)
+		os.rename(source, destination)
+
+class LevelFile:
+	def __init__(self, filename, compact_ratio=2, compact_minimum=256):
+		self.filename = filename
+		# compact when there are compact_ratio times more records than
+		# live segments, and more than compact_minimum records
+		self.compact_ratio = compact_ratio
+		self.compact_minimum = compact_minimum
+		self.saved = {} # key -> count of the segments in the file
+		self.records = 0 # records in the file
+		self.end = None # end of the last valid batch
+
+	def read(self):
+		"""
+		Returns the list of (line, (length, nx, ny)) stored in the file,
+		in the order they were added.
+		"""
+		live = [] # (key, normal) or None when removed
+		positions = {} # key -> positions in live
+		self.records = 0
+		with open(self.filename, 'rb') as level_file:
+			data = mmap(level_file.fileno(), 0, access=ACCESS_READ)
+			try:
+				magic, version, size = HEADER.unpack_from(data)
+				if magic != MAGIC:
+					raise ValueError("%s is not a level file" % self.filename)
+				if version != VERSION or size != RECORD.size:
+					raise ValueError("%s level version %d is not supported"
+						% (self.filename, version))
+				offset = HEADER.size
+				while offset + BATCH.size <= len(data):
+					count, crc = BATCH.unpack_from(data, offset)
+					start = offset + BATCH.size
+					end = start + count*RECORD.size
+					if end > len(data) or \
+						zlib.crc32(data[start:end]) & 0xffffffff != crc:
+						break # torn write of the last save
+					for position in range(start, end, RECORD.size):
+						record = RECORD.unpack_from(data, position)
+						key = record[1:5]
+						if record[0] == ADD:
+							positions.setdefault(key, []).append(len(live))
+							live.append((key, record[5:]))
+						elif positions.get(key):
+							live[positions[key].pop()] = None
+					self.records += count
+					offset = end
+				self.end = offset
+			finally:
+				data.close()
+		self.saved = {}
+		lines = []
+		for item in live:
+			if item is not None:
+				key, normal = item
+				x1, y1, x2, y2 = key
+				lines.append((Line(Point(x1, y1), Point(x2, y2)), normal))
+				self.saved[key] = self.saved.get(key, 0) + 1
+		return lines
+
+	def load(self, index):
+		""" Append the stored lines to a SegmentIndex, returns them """
+		lines = []
+		for line, normal in self.read():
+			index.append(line, normal)
+			lines.append(line)
+		return lines
+
+	def changes(self, lines):
+		""" The (op, line) records to go from the saved lines to lines """
+		counts = {}
+		records = []
+		for line in lines:
+			key = line_key(line)
+			counts[key] = counts.get(key, 0) + 1
+			if counts[key] > self.saved.get(key, 0):
+				records.append((ADD, line))
+		for key, count in self.saved.items():
+			for i in range(count - counts.get(key, 0)):
+				x1, y1, x2, y2 = key
+				records.append((REMOVE, Line(Point(x1, y1), Point(x2, y2))))
+		return records, counts
+
+	def save(self, lines):
+		""" Append the changes since the last save, returns the records """
+		if self.end is None and os.path.exists(self.filename) and \
+			is_binary_level(self.filename):
+			self.read()
+		records, counts = self.changes(lines)
+		live = len(lines)
+		if self.end is None or (self.records + len(records) >
+				max(self.compact_minimum, live * self.compact_ratio)):
+			self.compact(lines)
+			return len(records)
+		if not records:
+			return 0
+		with open(self.filename, 'r+b') as level_file:
+			level_file.seek(self.end)
+			level_file.truncate()
+			level_file.write(batch(records))
+			level_file.flush()
+			os.fsync(level_file.fileno())
+			self.end = level_file.tell()
+		self.records += len(records)
+		self.saved = counts
+		return len(records)
+
+	def compact(self, lines):
+		""" Rewrite the file with only the given lines """
+		new_filename = self.filename + '.new'
+		with open(new_filename, 'wb') as level_file:
+			level_file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+			level_file.write(batch([(ADD, line) for line in lines]))
+			level_file.flush()
+			os.fsync(level_file.fileno())
+			self.end = level_file.tell()
+		replace(new_filename, self.filename)
+		self.records = len(lines)
+		self.saved = {}
+		for line in lines:
+			key = line_key(line)
+			self.saved[key] = self.saved.get(key, 0) + 1
+
+def batch(records):
+	""" The bytes of a batch of (op, line) records """
+	data = b''.join(RECORD.pack(op, *(line_key(line) + line_normal(line)))
+		for op, line in records)
+	return BATCH.pack(len(records), zlib.crc32(data) & 0xffffffff) + data
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module provides the narrowphase tests of the polygon shapes:
+
+  The pairs of circles are tested inline in World.collide. When one of
+  the shapes is a polygon the bounding boxes are tested first
+  (aabb_overlap) and then the separating axis test (separation) finds
+  the smallest overlap, the axes are the polygon edge normals, and for a
+  circle the axis to the closest polygon vertex.
+
+	aabb_overlap(shape1, shape2, margin) - bounding boxes closer than margin
+	separation(shape1, shape2) - (depth, nx, ny) or None
+	segment_separation(shape, ax, ay, bx, by, nx, ny) - polygon and segment
+	support(shape, nx, ny) - the farthest point of a shape along an axis
+"""
+from math import sqrt
+from itertools import chain
+
+def aabb_overlap(shape1, shape2, margin=0):
+	left1, top1, right1, bottom1 = shape1.aabb()
+	left2, top2, right2, bottom2 = shape2.aabb()
+	return left1 - margin < right2 and left2 - margin < right1 and \
+		top1 - margin < bottom2 and top2 - margin < bottom1
+
+def extent(shape, nx, ny):
+	""" (min, max) of a shape on the axis (nx, ny), from its center """
+	if shape.polygon:
+		return shape.extent(nx, ny)
+	return -shape.radius, shape.radius
+
+def support(shape, nx, ny):
+	""" The point of a shape farthest along (nx, ny), eg. a contact point """
+	if not shape.polygon:
+		return shape.x + nx*shape.radius, shape.y + ny*shape.radius
+	px, py = max(shape.points, key=lambda p: p[0]*nx + p[1]*ny)
+	return shape.x + px, shape.y + py
+
+def circle_axis(circle, polygon):
+	""" Unit axis from the circle center to the closest polygon vertex """
+	x, y = circle.x - polygon.x, circle.y - polygon.y
+	dx, dy = min([(px - x, py - y) for px, py in polygon.points],
+		key=lambda d: d[0]*d[0] + d[1]*d[1])
+	length = sqrt(dx*dx + dy*dy)
+	if length:
+		return dx / length, dy / length
+
+def separation(shape1, shape2):
+	"""
+	Separating axis test of two shapes, at least one of them a polygon.
+	Returns (depth, nx, ny), the smallest overlap and its axis pointing
+	from shape1 to shape2, or None when they do not overlap.
+	"""
+	offset_x, offset_y = shape2.x - shape1.x, shape2.y - shape1.y
+	best, best_x, best_y = None, 0, 0
+	for owner, other in ((shape1, shape2), (shape2, shape1)):
+		# the extents of the owner on its own axes are known
+		if owner.polygon:
+			axes = zip(owner.axes, owner.extents)
+		else:
+			axis = circle_axis(owner, other)
+			if axis is None:
+				continue
+			axes = ((axis, (-owner.radius, owner.radius)),)
+		for (nx, ny), owner_extent in axes:
+			if owner is shape1:
+				(low1, high1), (low2, high2) = owner_extent, extent(other, nx, ny)
+			else:
+				(low1, high1), (low2, high2) = extent(other, nx, ny), owner_extent
+			# on the axis, relative to the center of shape1
+			offset = offset_x*nx + offset_y*ny
+			forward, backward = high1 - offset - low2, offset + high2 - low1
+			if forward <= 0 or backward <= 0:
+				return None # separated on this axis
+			if forward <= backward: # shape2 is ahead on the axis
+				depth = forward
+			else:
+				depth, nx, ny = backward, -nx, -ny
+			if best is None or depth < best:
+				best, best_x, best_y = depth, nx, ny
+	if best is None:
+		return None
+	return best, best_x, best_y
+
+def segment_separation(shape, ax, ay, bx, by, nx, ny):
+	"""
+	Separating axis test of a polygon and the segment from (ax, ay) to
+	(bx, by) with unit normal (nx, ny). Returns (depth, dx, dy), the
+	polygon must move depth along (dx, dy) to leave the segment, or None.
+	"""
+	# relative to the polygon center
+	ax, ay, bx, by = ax - shape.x, ay - shape.y, bx - shape.x, by - shape.y
+	best, best_x, best_y = None, 0, 0
+	axes = chain((((nx, ny), shape.extent(nx, ny)),),
+		zip(shape.axes, shape.extents))
+	for (axis_x, axis_y), (low, high) in axes:
+		a, b = ax*axis_x + ay*axis_y, bx*axis_x + by*axis_y
+		forward, backward = max(a, b) - low, high - min(a, b)
+		if forward <= 0 or backward <= 0:
+			return None
+		if forward <= backward: # push the polygon along the axis
+			depth = forward
+		else:
+			depth, axis_x, axis_y = backward, -axis_x, -axis_y
+		if best is None or depth < best:
+			best, best_x, best_y = depth, axis_x, axis_y
+	return best, best_x, best_y
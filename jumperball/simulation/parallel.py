@@ -0,0 +1,168 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module steps big worlds on several cores:
+
+  ParallelWorld
+    Splits the world width in vertical strips, each strip is stepped by
+    its own worker process. The shapes state is kept in two shared
+    buffers with the World.snapshot layout, one is read and the other is
+    written on each step, then they are swapped.
+    On each step a shape is owned by the strip containing its center.
+    Every worker steps the shapes of its strip together with the shapes
+    of the neighbour strips closer than halo to its borders (the ghosts),
+    and only writes back the shapes it owns. The contacts across a border
+    are solved on both sides, each side keeps the result for its own
+    shape, so the result only depends on the state and on the number of
+    strips, not on the workers timing.
+    The lines, static circles and settings are copied when the workers
+    are started, call restart after changing the world. sync writes the state back into the
+    world shapes.
+"""
+import ctypes
+from multiprocessing import Process, Pipe, RawArray, cpu_count
+from simulation.geometry import Point, Vector, Line
+from simulation.shapes import CircleShape
+from simulation.world import World, SNAPSHOT_HEADER, SNAPSHOT_FIELDS
+
+# World attributes copied to the workers
+SETTINGS = ('damping', 'friction', 'substeps', 'solver_iterations',
+	'overlap_tolerance', 'contact_margin')
+
+def run_strip(strip, strips, width, height, settings, gravity, lines,
+		statics, buffers, connection):
+	""" Worker process loop of one strip """
+	world = World(width, height)
+	for name, value in settings.items():
+		setattr(world, name, value)
+	world.gravity = Vector(*gravity)
+	world.sleep_steps = 0 # ghosts come and go, sleeping would not hold
+	world.lines.extend(Line(Point(x1, y1), Point(x2, y2))
+		for x1, y1, x2, y2 in lines)
+	for x, y, radius in statics:
+		world.add(CircleShape(Point(x, y), radius), True)
+	strip_width = float(width) / strips
+	left, right = strip * strip_width, (strip + 1) * strip_width
+	header, fields = len(SNAPSHOT_HEADER), len(SNAPSHOT_FIELDS)
+	shapes = {} # index in the buffers -> shape of this world
+	while True:
+		command = connection.recv()
+		if command is None:
+			return
+		current, halo = command
+		state, result = buffers[current], buffers[1 - current]
+		count = int(state[0])
+
+		# bring the shapes of the strip and its halo up to date
+		low, high = left - halo, right + halo
+		if strip == 0:
+			low = float('-inf')
+		if strip == strips - 1:
+			high = float('inf')
+		present = set()
+		owned = []
+		xs = state[header:header + count*fields:fields]
+		for index, x in enumerate(xs):
+			if not low <= x < high:
+				continue
+			present.add(index)
+			offset = header + index*fields
+			shape = shapes.get(index)
+			if shape is None:
+				shape = shapes[index] = CircleShape(Point(x, 0), 1)
+				world.add(shape)
+			shape.x, shape.y, shape.px, shape.py, shape.ax, shape.ay, \
+				shape.radius = state[offset:offset + fields]
+			# the strip of the shape, the first and last strips take the
+			# shapes outside of the world
+			owner = min(max(int(x // strip_width), 0), strips - 1)
+			if owner == strip:
+				owned.append((offset, shape))
+		for index in [index for index in shapes if index not in present]:
+			world.remove(shapes.pop(index))
+
+		world.step()
+
+		for offset, shape in owned:
+			result[offset:offset + fields] = [shape.x, shape.y, shape.px,
+				shape.py, shape.ax, shape.ay, shape.radius]
+		connection.send(len(owned))
+
+class ParallelWorld:
+	def __init__(self, world, strips=None, halo=None):
+		self.world = world
+		self.strips = strips or cpu_count()
+		self.halo = halo
+		self.workers = []
+		self.restart()
+
+	def restart(self):
+		""" Start the workers with the current world state """
+		self.close()
+		world = self.world
+		snapshot = world.snapshot()
+		self.buffers = (RawArray('d', len(snapshot)),
+			RawArray('d', len(snapshot)))
+		address, count = snapshot.buffer_info()
+		for buffer in self.buffers:
+			ctypes.memmove(buffer, address, count * snapshot.itemsize)
+		self.current = 0
+		if self.halo is None:
+			# enough for the contacts of the ghosts touching owned shapes
+			radius = max([s.radius for s in world.circle_shapes] or [0])
+			self.halo = 4*radius + world.contact_margin
+		settings = dict((name, getattr(world, name)) for name in SETTINGS)
+		gravity = world.gravity.x, world.gravity.y
+		lines = [(line.A.x, line.A.y, line.B.x, line.B.y)
+			for line in world.lines]
+		statics = [(shape.x, shape.y, shape.radius)
+			for shape in world.static_shapes]
+		self.workers = []
+		for strip in range(self.strips):
+			connection, worker_connection = Pipe()
+			process = Process(target=run_strip, args=(strip, self.strips,
+				world.width, world.height, settings, gravity, lines,
+				statics, self.buffers, worker_connection))
+			process.daemon = True
+			process.start()
+			self.workers.append((process, connection))
+
+	def step(self):
+		command = (self.current, self.halo)
+		for process, connection in self.workers:
+			connection.send(command)
+		for process, connection in self.workers:
+			connection.recv()
+		self.current = 1 - self.current
+
+	def state(self):
+		""" The buffer with the latest state, in the World.snapshot layout """
+		return self.buffers[self.current]
+
+	def sync(self):
+		""" Copy the latest state into the world shapes """
+		self.world.restore(self.state())
+
+	def close(self):
+		for process, connection in self.workers:
+			connection.send(None)
+			process.join()
+		self.workers = []
@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module provides the World.step profiler:
+
+  PhaseProfiler
+    Attached to a world it replaces the phase methods of that world
+    instance (collide, colide_with_lines, inertia, ...) by timed
+    wrappers, detached the class methods are used again, so a world
+    which is not profiled runs the same code as before.
+    For each step it records the time, the calls and the count (pairs
+    for collide, awake shapes for the other phases) of every phase, and
+    keeps the last window steps for the rolling statistics.
+    The collide calls of solve_overlaps are also counted in collide, so
+    the phases add up to more than the step.
+"""
+from collections import deque
+from timeit import default_timer as timer
+
+PHASES = ('check_wake_state', 'update_focus', 'store_positions',
+	'apply_friction', 'apply_gravity', 'accelerate', 'colide_with_lines',
+	'solve_overlaps', 'collide', 'border_collide', 'inertia', 'sweep',
+	'border_collide_preserve_impulse', 'update_sleep')
+
+def pair_count(world):
+	return len(world.contact_pairs or ())
+
+def shape_count(world):
+	return len(world.awake_shapes)
+
+class PhaseProfiler:
+	def __init__(self, window=120):
+		self.window = window
+		self.world = None
+		self.history = deque(maxlen=window) # per step {phase: (s, calls, count)}
+		self.current = {}
+
+	def attach(self, world):
+		self.detach()
+		self.world = world
+		for name in PHASES:
+			method = getattr(world, name)
+			count = pair_count if name == 'collide' else shape_count
+			setattr(world, name, self.timed(name, method, count))
+		setattr(world, 'step', self.timed_step(world.step))
+
+	def detach(self):
+		world = self.world
+		if world is None:
+			return
+		for name in PHASES + ('step',):
+			delattr(world, name)
+		self.world = None
+
+	def timed(self, name, method, count):
+		current, world = self.current, self.world
+		def timed_method(*args):
+			start = timer()
+			result = method(*args)
+			elapsed = timer() - start
+			seconds, calls, items = current.get(name, (0, 0, 0))
+			current[name] = (seconds + elapsed, calls + 1,
+				items + count(world))
+			return result
+		return timed_method
+
+	def timed_step(self, step):
+		current = self.current
+		def timed_step():
+			current.clear()
+			start = timer()
+			step()
+			current['step'] = (timer() - start, 1, len(self.world.awake_shapes))
+			self.history.append(dict(current))
+		return timed_step
+
+	def stats(self):
+		"""
+		Returns {phase: (mean ms per step, max ms, calls per step, count
+		per call)} over the recorded steps.
+		"""
+		steps = len(self.history)
+		if not steps:
+			return {}
+		totals = {}
+		for record in self.history:
+			for name, (seconds, calls, items) in record.items():
+				total, peak, all_calls, all_items = totals.get(name, (0, 0, 0, 0))
+				totals[name] = (total + seconds, max(peak, seconds),
+					all_calls + calls, all_items + items)
+		stats = {}
+		for name, (total, peak, calls, items) in totals.items():
+			stats[name] = (total * 1000 / steps, peak * 1000,
+				float(calls) / steps, float(items) / calls if calls else 0)
+		return stats
+
+	def report(self):
+		""" Text lines with the stats, the slowest phases first """
+		stats = self.stats()
+		lines = ["%-32s %7s %7s %6s %7s" % ("phase", "ms", "max", "calls",
+			"count")]
+		for name in sorted(stats, key=lambda name: -stats[name][0]):
+			lines.append("%-32s %7.3f %7.3f %6.1f %7.1f"
+				% ((name,) + stats[name]))
+		return lines
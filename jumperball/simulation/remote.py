@@ -0,0 +1,379 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module runs the World in a worker process:
+
+  RemoteWorld
+    Starts a process which steps a World at a fixed rate. After each step
+    the worker copies the World.snapshot of the world into one of two
+    shared memory buffers, the one the reader is not using, and marks it
+    as the latest, followed by the uid of each shape after room for
+    capacity shapes. latest() locks the latest buffer while the frame is
+    read, the shapes in circle_shapes read their values straight from
+    it. add returns a handle which finds its shape in the frames by its
+    uid, eg. for the camera to follow it.
+    Changes (add, remove, lines, gravity and the other settings) are
+    sent to the worker on a command queue. Only circles are stepped,
+    adding a polygon raises TypeError. The lines and the static circles
+    are also kept locally, in a SegmentIndex and a CircleGrid, for
+    drawing and picking.
+"""
+import ctypes
+import signal
+from array import array
+from multiprocessing import Process, Queue, RawArray, RawValue, Lock, Event
+from timeit import default_timer as timer
+from time import sleep
+try:
+	from queue import Empty
+except ImportError: # python 2
+	from Queue import Empty
+from simulation.geometry import Point, Vector, Line
+from simulation.shapes import CircleShape
+from simulation.segments import SegmentIndex
+from simulation.broadphase import CircleGrid
+from simulation.world import World, SNAPSHOT_HEADER, SNAPSHOT_FIELDS
+
+# settings forwarded to the worker world when set on the RemoteWorld
+SETTINGS = ('damping', 'friction', 'substeps', 'sleep_velocity',
+	'sleep_steps', 'solver_iterations', 'overlap_tolerance')
+
+def line_tuple(line):
+	return line.A.x, line.A.y, line.B.x, line.B.y
+
+def run_worker(world_class, width, height, rate, buffers, locks, latest,
+		commands, steps, ready):
+	""" The worker process loop """
+	# forked after pygame.init() the worker would keep the SDL handlers and
+	# ignore the terminate() of the exiting game
+	signal.signal(signal.SIGTERM, signal.SIG_DFL)
+	signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl-C is left to the game
+	ready.set()
+	world = world_class(width, height)
+	capacity = (len(buffers[0]) - len(SNAPSHOT_HEADER)) // \
+		(len(SNAPSHOT_FIELDS) + 1)
+	uids_start = len(SNAPSHOT_HEADER) + capacity * len(SNAPSHOT_FIELDS)
+	uids = {} # shape -> uid given by the RemoteWorld
+	shapes = {} # uid -> shape
+	lines = {} # (x1, y1, x2, y2) -> lines with those end points
+	statics = {} # (x, y, radius) -> static circles there
+	snapshot = array('d')
+	step_time = 1.0 / rate
+	next_step = timer()
+	while True:
+		# apply all the pending changes
+		while True:
+			try:
+				command = commands.get_nowait()
+			except Empty:
+				break
+			name, args = command[0], command[1:]
+			if name == 'stop':
+				return
+			elif name == 'add':
+				if len(world.circle_shapes) < capacity:
+					x, y, radius, continuous, uid = args
+					shape = CircleShape(Point(x, y), radius)
+					shape.continuous = continuous
+					shape = world.add(shape) or shape # ArrayWorld handles
+					uids[shape], shapes[uid] = uid, shape
+			elif name == 'remove':
+				shape = shapes.pop(args[0], None)
+				if shape is not None:
+					world.remove(shape)
+					del uids[shape]
+			elif name == 'add_static':
+				shape = CircleShape(Point(args[0], args[1]), args[2])
+				statics.setdefault(args, []).append(shape)
+				world.add(shape, True)
+			elif name == 'remove_static':
+				if statics.get(args):
+					world.remove(statics[args].pop())
+			elif name == 'remove_at':
+				x, y = args
+				for shape in [s for s in world.circle_shapes if s.hit_xy(x, y)]:
+					world.remove(shape)
+					del shapes[uids.pop(shape)]
+			elif name == 'line':
+				line = Line(Point(args[0], args[1]), Point(args[2], args[3]))
+				lines.setdefault(args, []).append(line)
+				world.lines.append(line)
+			elif name == 'remove_line':
+				if lines.get(args):
+					world.lines.remove(lines[args].pop())
+			elif name == 'clear_lines':
+				lines.clear()
+				world.lines.clear()
+			elif name == 'gravity':
+				world.gravity = Vector(*args)
+			elif name == 'set':
+				setattr(world, args[0], args[1])
+
+		world.step()
+		steps.value += 1
+
+		# publish to the buffer which is not the latest, unless the reader
+		# still holds it, then this step is not published
+		target = 1 - latest.value
+		if locks[target].acquire(False):
+			try:
+				world.snapshot(snapshot)
+				address, count = snapshot.buffer_info()
+				ctypes.memmove(buffers[target], address,
+					count * snapshot.itemsize)
+				circles = world.circle_shapes
+				buffers[target][uids_start:uids_start + len(circles)] = \
+					[uids[shape] for shape in circles]
+			finally:
+				locks[target].release()
+			latest.value = target
+
+		next_step += step_time
+		delay = next_step - timer()
+		if delay > 0:
+			sleep(delay)
+		elif delay < -step_time * 5: # too slow, do not try to catch up
+			next_step = timer()
+
+class RemoteShape(object):
+	""" Shape number index of the frame being read """
+	__slots__ = ('world', 'offset')
+	polygon = False
+
+	def __init__(self, world, index):
+		self.world = world
+		self.offset = len(SNAPSHOT_HEADER) + index * len(SNAPSHOT_FIELDS)
+
+	@property
+	def x(self):
+		return self.world.frame[self.offset]
+
+	@property
+	def y(self):
+		return self.world.frame[self.offset + 1]
+
+	@property
+	def radius(self):
+		return self.world.frame[self.offset + 6]
+
+	def center(self):
+		return Point(self.x, self.y)
+
+	def pos(self, alpha=1):
+		# the worker steps on its own clock, the latest positions are drawn
+		return int(self.x), int(self.y)
+
+	def hit_xy(self, x, y):
+		frame, offset = self.world.frame, self.offset
+		dx, dy = frame[offset] - x, frame[offset + 1] - y
+		radius = frame[offset + 6]
+		return dx*dx + dy*dy < radius*radius
+
+	def hit(self, P):
+		return self.hit_xy(P.x, P.y)
+
+class RemoteHandle(object):
+	"""
+	Shape added to a RemoteWorld, its values are read from the frame row
+	with its uid, they stay at the last ones read once it is removed
+	"""
+	__slots__ = ('world', 'uid', 'index', 'values')
+	polygon = False
+
+	def __init__(self, world, uid, x, y, radius):
+		self.world, self.uid = world, uid
+		self.index = -1 # row of the shape in the last frame read
+		self.values = x, y, radius
+
+	def read(self):
+		world = self.world
+		frame, start = world.frame, world.uids_start
+		count = int(frame[0])
+		index = self.index
+		if not 0 <= index < count or frame[start + index] != self.uid:
+			try:
+				index = frame[start:start + count].index(self.uid)
+			except ValueError: # not added yet, or removed
+				return self.values
+			self.index = index
+		offset = len(SNAPSHOT_HEADER) + index * len(SNAPSHOT_FIELDS)
+		self.values = frame[offset], frame[offset + 1], frame[offset + 6]
+		return self.values
+
+	@property
+	def x(self):
+		return self.read()[0]
+
+	@property
+	def y(self):
+		return self.read()[1]
+
+	@property
+	def radius(self):
+		return self.read()[2]
+
+	def center(self):
+		return Point(self.x, self.y)
+
+	def pos(self, alpha=1):
+		x, y, radius = self.read()
+		return int(x), int(y)
+
+class RemoteLines(SegmentIndex):
+	""" SegmentIndex which also sends its changes to the worker """
+	def __init__(self, commands):
+		self.commands = commands
+		SegmentIndex.__init__(self)
+
+	def append(self, line, normal=None):
+		SegmentIndex.append(self, line, normal)
+		self.commands.put(('line',) + line_tuple(line))
+
+	def remove(self, line):
+		SegmentIndex.remove(self, line)
+		self.commands.put(('remove_line',) + line_tuple(line))
+
+	def clear(self):
+		SegmentIndex.clear(self)
+		if hasattr(self, 'commands'):
+			self.commands.put(('clear_lines',))
+
+class RemoteWorld(object):
+	def __init__(self, width, height, world_class=World, rate=60,
+			capacity=4096):
+		# the frames, then the uid of each shape
+		self.uids_start = len(SNAPSHOT_HEADER) + \
+			capacity * len(SNAPSHOT_FIELDS)
+		size = self.uids_start + capacity
+		self.buffers = (RawArray('d', size), RawArray('d', size))
+		self.locks = (Lock(), Lock())
+		self.latest_buffer = RawValue('i', 0)
+		self.steps = RawValue('i', 0) # steps run by the worker
+		ready = Event() # set when the worker handles the signals
+		self.commands = Queue()
+		self.width, self.height = width, height
+		self.lines = RemoteLines(self.commands)
+		self.circle_shapes = []
+		self.polygon_shapes = [] # the worker only steps circles
+		self.static_shapes = CircleGrid()
+		self.static_version = 0
+		self.next_uid = 0
+		self.frame = self.buffers[0]
+		self._gravity = Vector(0, 0)
+		self.process = Process(target=run_worker, args=(world_class, width,
+			height, rate, self.buffers, self.locks, self.latest_buffer,
+			self.commands, self.steps, ready))
+		self.process.daemon = True
+		self.process.start()
+		# until then the worker could not be terminated
+		ready.wait(10)
+
+	def __setattr__(self, name, value):
+		if name in SETTINGS:
+			self.commands.put(('set', name, value))
+		object.__setattr__(self, name, value)
+
+	def get_gravity(self):
+		return self._gravity
+
+	def set_gravity(self, gravity):
+		self._gravity = gravity
+		self.commands.put(('gravity', gravity.x, gravity.y))
+
+	gravity = property(get_gravity, set_gravity)
+
+	def add(self, shape, static=False):
+		""" Returns the RemoteHandle of the shape, static shapes are kept """
+		if shape.polygon:
+			raise TypeError("RemoteWorld only steps circles")
+		if static:
+			# static circles do not move, they are drawn from the local copy
+			self.static_shapes.add(shape)
+			self.static_version += 1
+			self.commands.put(('add_static', shape.x, shape.y, shape.radius))
+			return shape
+		uid = self.next_uid
+		self.next_uid += 1
+		self.commands.put(('add', shape.x, shape.y, shape.radius,
+			getattr(shape, 'continuous', False), uid))
+		return RemoteHandle(self, uid, shape.x, shape.y, shape.radius)
+
+	def remove(self, shape):
+		"""
+		Remove the static shape, the shape of a RemoteHandle, or the shapes
+		at the position of shape
+		"""
+		if shape in self.static_shapes:
+			self.static_shapes.remove(shape)
+			self.static_version += 1
+			self.commands.put(('remove_static', shape.x, shape.y, shape.radius))
+			return
+		if isinstance(shape, RemoteHandle):
+			self.commands.put(('remove', shape.uid))
+			return
+		self.commands.put(('remove_at', shape.x, shape.y))
+
+	def step(self):
+		""" The worker steps the world on its own """
+		pass
+
+	def shapes_in(self, left, top, right, bottom):
+		return [shape for shape in self.circle_shapes
+			if shape.x + shape.radius >= left and shape.x - shape.radius <= right
+			and shape.y + shape.radius >= top and shape.y - shape.radius <= bottom]
+
+	def latest(self):
+		"""
+		Lock the latest published frame, use as:
+			with world.latest():
+				... read world.circle_shapes
+		"""
+		return LatestFrame(self)
+
+	def close(self):
+		if self.process.is_alive():
+			self.commands.put(('stop',))
+			self.process.join(1)
+		if self.process.is_alive():
+			self.process.terminate()
+			self.process.join()
+
+class LatestFrame:
+	def __init__(self, world):
+		self.world = world
+
+	def __enter__(self):
+		world = self.world
+		# the worker may publish to the other buffer meanwhile, this one
+		# stays complete while it is locked
+		index = world.latest_buffer.value
+		self.lock = world.locks[index]
+		self.lock.acquire()
+		world.frame = world.buffers[index]
+		count = int(world.frame[0])
+		shapes = world.circle_shapes
+		while len(shapes) < count:
+			shapes.append(RemoteShape(world, len(shapes)))
+		del shapes[count:]
+		return world.frame
+
+	def __exit__(self, *exc_info):
+		self.lock.release()
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module provides the world history:
+
+  RewindBuffer
+    Ring of the last World.snapshot buffers, one per recorded step. The
+    buffers are allocated once and reused, recording only grows them when
+    there are more shapes than before.
+"""
+from array import array
+
+class RewindBuffer:
+	def __init__(self, world, seconds=5, rate=60):
+		self.world = world
+		self.rate = rate
+		self.frames = [array('d') for i in range(int(seconds * rate))]
+		self.newest = -1 # position of the last recorded frame
+		self.count = 0 # recorded frames
+
+	def __len__(self):
+		return self.count
+
+	def seconds(self):
+		""" Seconds of history available """
+		return float(self.count) / self.rate
+
+	def record(self):
+		""" Store the world state, the oldest frame is overwritten """
+		self.newest = (self.newest + 1) % len(self.frames)
+		self.world.snapshot(self.frames[self.newest])
+		self.count = min(self.count + 1, len(self.frames))
+
+	def frame(self, back=0):
+		""" The buffer recorded back frames before the last one """
+		if not 0 <= back < self.count:
+			raise IndexError("only %d frames recorded" % self.count)
+		return self.frames[(self.newest - back) % len(self.frames)]
+
+	def rewind(self, back=1):
+		"""
+		Restore the world as it was back frames before the last one, the
+		newer frames are dropped. Returns the frames rewound.
+		"""
+		back = min(back, self.count - 1)
+		if back < 0:
+			return 0
+		self.world.restore(self.frame(back))
+		self.newest = (self.newest - back) % len(self.frames)
+		self.count -= back
+		return back
+
+	def clear(self):
+		self.newest, self.count = -1, 0
@@ -0,0 +1,335 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module provides classes for:
+
+  SegmentIndex
+    The container for the World lines. It behaves like a list of lines
+    (append, remove, iteration) and keeps a uniform grid of the cells
+    crossed by each segment, so that queries only look at the lines near
+    the queried area. The segments are compiled into a table (origin,
+    direction, inverse squared length and unit normal) when they are
+    added, so contact tests do not recompute them:
+      query_point - lines within a distance of a point
+      query_circle - lines touching a circle, with the contact point
+      raycast - first line hit by a ray
+"""
+from math import hypot
+from simulation.geometry import Point
+
+class SegmentIndex:
+	def __init__(self, lines=(), cell_size=32):
+		self.cell_size = cell_size
+		self.clear()
+		for line in lines:
+			self.append(line)
+
+	def __iter__(self):
+		return iter(self.lines)
+
+	def __len__(self):
+		return len(self.lines)
+
+	def __getitem__(self, index):
+		return self.lines[index]
+
+	def __contains__(self, line):
+		return line in self.line_slot
+
+	def __repr__(self):
+		return "<SegmentIndex> %d lines" % len(self.lines)
+
+	def clear(self):
+		self.lines = []
+		self.cells = {}       # (column, row) -> slots crossing that cell
+		self.line_slot = {}   # line -> slot in the segment table
+		self.line_cells = {}  # line -> cell keys, used on remove
+		self.line_points = {} # merged line -> the drawn points it replaced
+		self.free = []        # slots of removed lines, reused on append
+		# Segment table, one list per column, indexed by slot:
+		#   origin (ox, oy), direction (dx, dy), 1/length^2 (inverse),
+		#   unit normal (nx, ny)
+		self.slot_line = []
+		self.ox, self.oy, self.dx, self.dy = [], [], [], []
+		self.inverse, self.nx, self.ny = [], [], []
+		self.stamp = []       # last query which visited the slot
+		self.found = []       # reused by nearby
+		self.query = 0
+		# changes each time the index is modified, also counts the clears
+		self.version = getattr(self, 'version', -1) + 1
+
+	def cell(self, x, y):
+		size = self.cell_size
+		return int(x // size), int(y // size)
+
+	def segment_cells(self, line):
+		""" Keys of the grid cells crossed by the segment """
+		A, B = line.A, line.B
+		if A.x > B.x:
+			A, B = B, A
+		size = self.cell_size
+		column0, column1 = int(A.x // size), int(B.x // size)
+		dx, dy = B.x - A.x, B.y - A.y
+		keys = []
+		for column in range(column0, column1+1):
+			# the part of the segment inside this column
+			if dx:
+				left = max(A.x, column*size)
+				right = min(B.x, (column+1)*size)
+				y1 = A.y + (left - A.x) * dy / dx
+				y2 = A.y + (right - A.x) * dy / dx
+			else:
+				y1, y2 = A.y, B.y
+			row0, row1 = int(min(y1, y2) // size), int(max(y1, y2) // size)
+			for row in range(row0, row1+1):
+				keys.append((column, row))
+		return keys
+
+	def compile(self, slot, line, normal=None):
+		"""
+		Store the line constants in the segment table, normal is the
+		precomputed (length, nx, ny) if known.
+		"""
+		A, B = line.A, line.B
+		dx, dy = float(B.x - A.x), float(B.y - A.y)
+		if normal is None:
+			length = hypot(dx, dy)
+			if length:
+				normal = length, -dy / length, dx / length
+		else:
+			length = normal[0]
+		self.slot_line[slot] = line
+		self.ox[slot], self.oy[slot] = A.x, A.y
+		self.dx[slot], self.dy[slot] = dx, dy
+		if length:
+			self.inverse[slot] = 1 / (length*length)
+			self.nx[slot], self.ny[slot] = normal[1], normal[2]
+		else: # a point, contacts are always with the end points
+			self.inverse[slot] = self.nx[slot] = self.ny[slot] = 0.0
+
+	def append(self, line, normal=None):
+		if self.free:
+			slot = self.free.pop()
+		else:
+			slot = len(self.slot_line)
+			for column in (self.slot_line, self.ox, self.oy, self.dx, self.dy,
+					self.inverse, self.nx, self.ny):
+				column.append(None)
+			self.stamp.append(0)
+		self.compile(slot, line, normal)
+		keys = self.segment_cells(line)
+		cells = self.cells
+		for key in keys:
+			cell = cells.get(key)
+			if cell is None:
+				cells[key] = [slot]
+			else:
+				cell.append(slot)
+		self.line_slot[line] = slot
+		self.line_cells[line] = keys
+		self.lines.append(line)
+		self.version += 1
+
+	def extend(self, lines):
+		for line in lines:
+			self.append(line)
+
+	def remove(self, line):
+		slot = self.line_slot.pop(line)
+		cells = self.cells
+		for key in self.line_cells.pop(line):
+			cell = cells[key]
+			cell.remove(slot)
+			if not cell:
+				del cells[key]
+		self.line_points.pop(line, None)
+		self.slot_line[slot] = None
+		self.free.append(slot)
+		self.lines.remove(line)
+		self.version += 1
+
+	def nearby(self, x, y, radius):
+		"""
+		Slots of the segments in the cells overlapped by the square around
+		(x, y), each slot is only returned once. The returned list is reused
+		by the next call.
+		"""
+		size = self.cell_size
+		column0, column1 = int((x-radius) // size), int((x+radius) // size)
+		row0, row1 = int((y-radius) // size), int((y+radius) // size)
+		cells = self.cells
+		if column0 == column1 and row0 == row1:
+			return cells.get((column0, row0), ())
+		self.query += 1
+		query, stamp = self.query, self.stamp
+		found = self.found
+		del found[:]
+		for column in range(column0, column1+1):
+			for row in range(row0, row1+1):
+				for slot in cells.get((column, row), ()):
+					if stamp[slot] != query:
+						stamp[slot] = query
+						found.append(slot)
+		return found
+
+	def query_box(self, left, top, right, bottom):
+		""" Lines in the cells overlapped by the box, eg. a viewport """
+		size = self.cell_size
+		column0, column1 = int(left // size), int(right // size)
+		row0, row1 = int(top // size), int(bottom // size)
+		self.query += 1
+		query, stamp, slot_line = self.query, self.stamp, self.slot_line
+		cells = self.cells
+		if (column1 - column0 + 1) * (row1 - row0 + 1) > len(cells):
+			# a big box, look at the cells there are instead
+			covered = [cell for (column, row), cell in cells.items()
+				if column0 <= column <= column1 and row0 <= row <= row1]
+		else:
+			covered = [cells[key] for key in ((column, row)
+				for column in range(column0, column1+1)
+				for row in range(row0, row1+1)) if key in cells]
+		found = []
+		for cell in covered:
+			for slot in cell:
+				if stamp[slot] != query:
+					stamp[slot] = query
+					found.append(slot_line[slot])
+		return found
+
+	def contact(self, slot, x, y):
+		"""
+		Returns (distance, normal x, normal y) from the segment to point
+		(x, y), the normal points from the segment to the point.
+		"""
+		rx, ry = x - self.ox[slot], y - self.oy[slot]
+		dx, dy = self.dx[slot], self.dy[slot]
+		u = (rx*dx + ry*dy) * self.inverse[slot]
+		if 0 < u < 1:
+			nx, ny = self.nx[slot], self.ny[slot]
+			distance = rx*nx + ry*ny
+			if distance < 0:
+				return -distance, -nx, -ny
+			return distance, nx, ny
+		if u >= 1:
+			rx, ry = rx - dx, ry - dy
+		distance = hypot(rx, ry)
+		if not distance:
+			return 0.0, self.nx[slot], self.ny[slot]
+		return distance, rx / distance, ry / distance
+
+	def query_point(self, P, radius=0):
+		""" Lines which are at most radius away from point P """
+		return [self.slot_line[slot] for slot in self.nearby(P.x, P.y, radius)
+			if self.contact(slot, P.x, P.y)[0] <= radius]
+
+	def query_circle(self, C):
+		"""
+		Yields (line, contact point) for the lines touching circle C.
+		Each contact is computed when it is reached, so the caller may move
+		the circle out of a line before the next line is checked.
+		"""
+		for slot in list(self.nearby(C.x, C.y, C.radius)):
+			distance, nx, ny = self.contact(slot, C.x, C.y)
+			if distance <= C.radius:
+				point = Point(C.x - nx*distance, C.y - ny*distance)
+				yield self.slot_line[slot], point
+
+	def bounds(self):
+		""" Cells range (column0, row0, column1, row1) covered by lines """
+		columns = [key[0] for key in self.cells]
+		rows = [key[1] for key in self.cells]
+		return min(columns), min(rows), max(columns), max(rows)
+
+	def raycast(self, origin, direction, max_distance=None):
+		"""
+		Returns (line, point, distance) for the first line hit by the ray
+		starting at origin along direction, or None.
+		The grid cells are walked in the ray order, so only the lines in
+		the cells crossed by the ray are tested.
+		"""
+		if not self.cells:
+			return None
+		length = hypot(direction.x, direction.y)
+		dx, dy = direction.x / float(length), direction.y / float(length)
+		size = self.cell_size
+		column, row = self.cell(origin.x, origin.y)
+		column0, row0, column1, row1 = self.bounds()
+		step_x = 1 if dx > 0 else -1
+		step_y = 1 if dy > 0 else -1
+		infinity = float('inf')
+		# ray distance to the next vertical/horizontal cell border
+		if dx:
+			border = (column + (dx > 0)) * size
+			next_x, delta_x = (border - origin.x) / dx, size / abs(dx)
+		else:
+			next_x = delta_x = infinity
+		if dy:
+			border = (row + (dy > 0)) * size
+			next_y, delta_y = (border - origin.y) / dy, size / abs(dy)
+		else:
+			next_y = delta_y = infinity
+		if max_distance is None:
+			max_distance = infinity
+		best = None
+		best_distance = max_distance
+		tested = set()
+		while True:
+			for slot in self.cells.get((column, row), ()):
+				if slot in tested:
+					continue
+				tested.add(slot)
+				line = self.slot_line[slot]
+				distance = ray_segment(origin, dx, dy, line)
+				if distance is not None and distance <= best_distance:
+					best, best_distance = line, distance
+			cell_exit = min(next_x, next_y)
+			if best_distance <= cell_exit or cell_exit > max_distance:
+				break
+			if next_x < next_y:
+				column += step_x
+				next_x += delta_x
+			else:
+				row += step_y
+				next_y += delta_y
+			# left the indexed area moving away from it
+			if (column < column0 and step_x < 0) \
+				or (column > column1 and step_x > 0) \
+				or (row < row0 and step_y < 0) \
+				or (row > row1 and step_y > 0):
+				break
+		if best is None:
+			return None
+		point = Point(origin.x + dx*best_distance, origin.y + dy*best_distance)
+		return best, point, best_distance
+
+def ray_segment(origin, dx, dy, line):
+	""" Distance along the (unit) ray to segment line, None if missed """
+	A, B = line.A, line.B
+	ex, ey = B.x - A.x, B.y - A.y
+	denominator = dx*ey - dy*ex
+	if not denominator:
+		return None
+	ox, oy = A.x - origin.x, A.y - origin.y
+	distance = (ox*ey - oy*ex) / denominator
+	s = (ox*dy - oy*dx) / denominator
+	if distance < 0 or s < 0 or s > 1:
+		return None
+	return distance
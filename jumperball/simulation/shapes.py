@@ -22,24 +22,54 @@
   This module provides classes for:
   
   Shapes:
-    Circle, Triangle, Rectangle
+    Circle, Rectangle, Polygon (convex, eg. triangles)
+
+  Every shape has a position (x, y) and a bounding radius, which is what
+  the broadphases use, and a cheap axis aligned bounding box (aabb). The
+  polygons are tested with the separating axis test (see narrowphase)
+  only after their bounding boxes overlap. Polygons move but they do not
+  rotate.
 """
 from math import sqrt, hypot, pi, sin, cos, atan2
 from simulation.geometry import Point
 
-class CircleShape:
-	""" Circle shape centered at point P """
+class Shape(object):
+	""" Verlet body at point P, the base of the shapes """
+	__slots__ = ('x', 'y', 'radius', 'px', 'py', 'lx', 'ly', 'ax', 'ay',
+		'sleeping', 'idle', 'island', 'continuous', 'uid')
+	polygon = False # polygons need the SAT narrowphase
+
 	def __init__(self, P, radius):
 		self.x, self.y, self.radius = P.x, P.y, radius
 		self.px, self.py = P.x, P.y
+		self.lx, self.ly = P.x, P.y # position before the last world step
 		self.ax = self.ay = 0
+		self.sleeping = False
+		self.idle = 0 # steps since the shape is almost stopped
+		self.island = None # shapes sleeping together with this one
+		self.continuous = False # swept collision tests, for fast shapes
+		self.uid = -1 # set by World.add, identifies the shape in the contacts
 
 	def center(self):
 		return Point(self.x, self.y)
+
+	def pos(self, alpha=1):
+		""" Position between the last step (alpha 0) and now (alpha 1) """
+		lx, ly = self.lx, self.ly
+		return (int(lx + (self.x-lx)*alpha), int(ly + (self.y-ly)*alpha))
+
+	def aabb(self):
+		""" (left, top, right, bottom) """
+		x, y, radius = self.x, self.y, self.radius
+		return x - radius, y - radius, x + radius, y + radius
 		
+	def distance2(self, x, y):
+		""" squared distance from the center to (x, y) """
+		dx, dy = self.x-x, self.y-y
+		return dx*dx + dy*dy
+
 	def hit(self, P):
-		length = self.center().distance_to(P)
-		return length < self.radius
+		return self.hit_xy(P.x, P.y)
 					
 	def accelerate(self, delta):
 		self.x += self.ax * delta * delta
@@ -56,13 +86,89 @@ class CircleShape:
 		x = (self.px - self.x)
 		y = (self.py - self.y)
 		length = hypot(x, y)
-		if x <> 0:			
+		if x != 0:			
 			self.ax += (x/length)*friction
 			if abs(x) < 0.04: # stop on residual acceleration
 				self.ax = 0
 				self.px = self.x			
-		if y <> 0:
+		if y != 0:
 			self.ay += (y/length)*friction
 			if abs(y) < 0.04:  # stop on residual acceleration
 				self.ay = 0
 				self.py = self.y
+
+class CircleShape(Shape):
+	""" Circle shape centered at point P """
+	__slots__ = ()
+
+	def hit_xy(self, x, y):
+		return self.distance2(x, y) < self.radius*self.radius
+
+class PolygonShape(Shape):
+	"""
+	Convex polygon, points are (x, y) relative to the center P, which
+	must be inside the polygon
+	"""
+	__slots__ = ('points', 'normals', 'axes', 'extents', 'bounds')
+	polygon = True
+
+	def __init__(self, P, points):
+		points = tuple((float(x), float(y)) for x, y in points)
+		Shape.__init__(self, P, max(hypot(x, y) for x, y in points))
+		self.points = points
+		# outward unit normal of each edge, from points[i] to points[i+1]
+		normals = []
+		for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+			length = hypot(x2 - x1, y2 - y1)
+			nx, ny = (y2 - y1) / length, (x1 - x2) / length
+			if nx*x1 + ny*y1 < 0:
+				nx, ny = -nx, -ny
+			normals.append((nx, ny))
+		self.normals = tuple(normals)
+		# the separating axes, parallel edges share one, with the (min,
+		# max) of the points on them, they are constant as there is no
+		# rotation
+		axes = []
+		for nx, ny in normals:
+			if not [a for a in axes if abs(a[0]*ny - a[1]*nx) < 1e-9]:
+				axes.append((nx, ny))
+		self.axes = tuple(axes)
+		self.extents = tuple(self.extent(nx, ny) for nx, ny in axes)
+		xs, ys = [x for x, y in points], [y for x, y in points]
+		self.bounds = min(xs), min(ys), max(xs), max(ys) # relative aabb
+
+	def aabb(self):
+		x, y = self.x, self.y
+		left, top, right, bottom = self.bounds
+		return x + left, y + top, x + right, y + bottom
+
+	def vertices(self, alpha=1):
+		""" The points at pos(alpha), for drawing """
+		x, y = self.pos(alpha)
+		return [(x + px, y + py) for px, py in self.points]
+
+	def extent(self, nx, ny):
+		""" (min, max) of the points on the axis (nx, ny), from the center """
+		values = [px*nx + py*ny for px, py in self.points]
+		return min(values), max(values)
+
+	def project(self, nx, ny):
+		""" (min, max) of the polygon on the axis (nx, ny) """
+		center = self.x*nx + self.y*ny
+		low, high = self.extent(nx, ny)
+		return center + low, center + high
+
+	def hit_xy(self, x, y):
+		x, y = x - self.x, y - self.y
+		for (px, py), (nx, ny) in zip(self.points, self.normals):
+			if (x - px)*nx + (y - py)*ny > 0:
+				return False
+		return True
+
+class RectangleShape(PolygonShape):
+	""" Rectangle centered at point P """
+	__slots__ = ()
+
+	def __init__(self, P, width, height):
+		w, h = width / 2.0, height / 2.0
+		PolygonShape.__init__(self, P, ((-w, -h), (w, -h), (w, h), (-w, h)))
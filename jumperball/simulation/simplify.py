@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module reduces the number of segments of a SegmentIndex:
+
+  Segments shorter than the tolerance are dropped. Two segments are
+  merged into one when they overlap, or the gap between them is at most
+  the tolerance, and the segment between their two farthest end points
+  passes within the tolerance of the other end points and of the drawn
+  points the two segments already replaced. Those are kept in the
+  line_points of the index, so repeated merges stay within the
+  tolerance of the drawn lines.
+
+    merge(line1, line2, tolerance, replaced) - the merged Line or None
+    merge_line(index, line, tolerance) - merge a line with its neighbours
+    simplify(index, tolerance) - merge all the lines of the index
+"""
+from math import hypot
+from simulation.geometry import Line
+
+def segment_distance(x, y, ax, ay, ux, uy, length):
+	"""
+	Distance from (x, y) to the segment from (ax, ay), with unit direction
+	u and length
+	"""
+	position = min(max((x - ax)*ux + (y - ay)*uy, 0), length)
+	return hypot(x - ax - ux*position, y - ay - uy*position)
+
+def merge(line1, line2, tolerance=0.5, replaced=None):
+	"""
+	Returns a Line covering both collinear segments, or None. replaced is
+	the line -> replaced drawn points dict (SegmentIndex.line_points),
+	the points of the merged line are stored there.
+	"""
+	if hypot(line2.B.x - line2.A.x, line2.B.y - line2.A.y) > \
+			hypot(line1.B.x - line1.A.x, line1.B.y - line1.A.y):
+		line1, line2 = line2, line1
+	A, B = line1.A, line1.B
+	length = hypot(B.x - A.x, B.y - A.y)
+	if not length:
+		return None
+	ux, uy = (B.x - A.x) / length, (B.y - A.y) / length
+	# positions of the end points along the longer line
+	points = [(0, A), (length, B)]
+	for P in (line2.A, line2.B):
+		points.append(((P.x - A.x)*ux + (P.y - A.y)*uy, P))
+	start2, end2 = sorted((points[2][0], points[3][0]))
+	if start2 > length + tolerance or end2 < -tolerance:
+		return None # apart
+	points.sort(key=lambda point: point[0])
+	E, F = points[0][1], points[-1][1]
+	inner = [P for position, P in points[1:-1]]
+	if replaced is not None:
+		inner.extend(replaced.get(line1, ()))
+		inner.extend(replaced.get(line2, ()))
+	# the merged segment must pass within tolerance of the inner points
+	length = hypot(F.x - E.x, F.y - E.y)
+	ux, uy = (F.x - E.x) / length, (F.y - E.y) / length
+	for P in inner:
+		if segment_distance(P.x, P.y, E.x, E.y, ux, uy, length) > tolerance:
+			return None
+	line = Line(E, F)
+	if replaced is not None:
+		replaced[line] = inner
+	return line
+
+def merge_line(index, line, tolerance=0.5):
+	"""
+	Merge line, which is in the index, with the collinear lines around
+	it, until no more merges are possible. Returns the number of segments
+	removed.
+	"""
+	removed = 0
+	A, B = line.A, line.B
+	if hypot(B.x - A.x, B.y - A.y) <= tolerance:
+		index.remove(line)
+		return 1
+	merged = True
+	while merged:
+		merged = False
+		A, B = line.A, line.B
+		radius = hypot(B.x - A.x, B.y - A.y) / 2 + tolerance
+		slots = list(index.nearby((A.x + B.x) / 2.0, (A.y + B.y) / 2.0, radius))
+		for slot in slots:
+			other = index.slot_line[slot]
+			if other is line or other is None:
+				continue
+			new_line = merge(line, other, tolerance, index.line_points)
+			if new_line is not None:
+				index.remove(line)
+				index.remove(other)
+				index.append(new_line)
+				line = new_line
+				removed += 1
+				merged = True
+				break
+	return removed
+
+def simplify(index, tolerance=0.5):
+	""" Merge all the lines of the index, returns the segments removed """
+	removed = 0
+	for line in list(index):
+		if line in index:
+			removed += merge_line(index, line, tolerance)
+	return removed
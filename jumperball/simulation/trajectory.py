@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@copyright:
+  (C) Copyright 2012, Open Source Game Seed <devs at osgameseed dot org>
+
+@license:
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@doc:
+  This module records the shape positions of long runs to a file:
+
+  Trajectory files
+    A header (magic, version, fields, shapes, steps) followed by one row
+    block per step: for each shape its fields (x, y and optionally the
+    velocity vx, vy) as little endian float32. Every block has room for
+    the same number of shapes. A shape keeps the column it got when it
+    was first recorded, whatever its place in the world lists, the
+    columns of the shapes which are missing (removed, not added yet)
+    are NaN.
+
+  TrajectoryRecorder
+    Appends the blocks through a memory map of the file, which is grown
+    (doubled) when full and truncated to the recorded steps on close.
+    The header steps are updated on every step, so a file can be read
+    while it is being recorded. See World.record_trajectory.
+
+  TrajectoryReader
+    array() maps the file as a (steps, shapes, fields) numpy.memmap, the
+    steps are only read from the disk when they are used. Iterating
+    yields the block of each step, chunks() blocks of many steps.
+"""
+import sys
+import struct
+from array import array
+from itertools import repeat
+from mmap import mmap, ACCESS_READ
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+MAGIC = b'JBTR'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII') # magic, version, fields, shapes, steps
+FIELDS = ('x', 'y', 'vx', 'vy')
+NAN = float('nan')
+
+def to_bytes(values):
+	if sys.byteorder == 'big':
+		values.byteswap()
+	if hasattr(values, 'tobytes'):
+		return values.tobytes()
+	return values.tostring() # python 2
+
+class TrajectoryRecorder:
+	def __init__(self, filename, shapes, velocity=False, chunk=1024):
+		self.filename = filename
+		self.fields = FIELDS[:4 if velocity else 2]
+		self.shapes = shapes # room for shapes per step, more are truncated
+		self.block = shapes * len(self.fields) * 4
+		self.steps = 0
+		self.capacity = 0 # steps which fit in the file
+		self.truncated = 0 # steps which had more shapes than room
+		self.columns = {} # shape uid -> its column in the blocks
+		self.file = open(filename, 'w+b')
+		self.data = None
+		self.grow(chunk)
+
+	def grow(self, steps):
+		""" Resize the file to hold steps steps, and map it again """
+		if self.data is not None:
+			self.data.close()
+		self.capacity = steps
+		self.file.truncate(HEADER.size + steps * self.block)
+		self.data = mmap(self.file.fileno(), HEADER.size + steps * self.block)
+		self.write_header()
+
+	def write_header(self):
+		HEADER.pack_into(self.data, 0, MAGIC, VERSION, len(self.fields),
+			self.shapes, self.steps)
+
+	def record(self, shapes):
+		"""
+		Append the block of one step with the fields of shapes, in the
+		column of each shape
+		"""
+		if self.steps == self.capacity:
+			self.grow(max(1, self.capacity * 2))
+		columns = self.columns
+		fields = len(self.fields)
+		values = array('f', repeat(NAN, self.shapes * fields))
+		truncated = False
+		for shape in shapes:
+			column = columns.get(shape.uid)
+			if column is None:
+				if len(columns) == self.shapes:
+					truncated = True
+					continue
+				column = columns[shape.uid] = len(columns)
+			index = column * fields
+			x, y = shape.x, shape.y
+			values[index] = x
+			values[index + 1] = y
+			if fields == 4:
+				values[index + 2] = x - shape.px
+				values[index + 3] = y - shape.py
+		if truncated:
+			self.truncated += 1
+		offset = HEADER.size + self.steps * self.block
+		self.data[offset:offset + self.block] = to_bytes(values)
+		self.steps += 1
+		self.write_header()
+
+	def flush(self):
+		self.data.flush()
+
+	def close(self):
+		""" Truncate the file to the recorded steps """
+		if self.file is None:
+			return
+		self.data.close()
+		self.data = None
+		self.file.truncate(HEADER.size + self.steps * self.block)
+		self.file.close()
+		self.file = None
+
+class TrajectoryReader:
+	def __init__(self, filename):
+		self.filename = filename
+		with open(filename, 'rb') as trajectory_file:
+			data = trajectory_file.read(HEADER.size)
+			trajectory_file.seek(0, 2)
+			size = trajectory_file.tell()
+		if len(data) < HEADER.size:
+			raise ValueError("%s is not a trajectory file" % filename)
+		magic, version, fields, shapes, steps = HEADER.unpack(data)
+		if magic != MAGIC:
+			raise ValueError("%s is not a trajectory file" % filename)
+		if version != VERSION:
+			raise ValueError("%s trajectory version %d is not supported"
+				% (filename, version))
+		self.fields = FIELDS[:fields]
+		self.shapes = shapes
+		self.block = shapes * fields * 4
+		# a file being recorded is larger than its steps
+		if self.block:
+			steps = min(steps, (size - HEADER.size) // self.block)
+		self.steps = steps
+
+	def __len__(self):
+		return self.steps
+
+	def array(self):
+		""" The (steps, shapes, fields) float32 numpy.memmap of the file """
+		if numpy is None:
+			raise ImportError("TrajectoryReader.array needs NumPy")
+		shape = (self.steps, self.shapes, len(self.fields))
+		if not self.steps or not self.block:
+			return numpy.zeros(shape, dtype='<f4')
+		return numpy.memmap(self.filename, dtype='<f4', mode='r',
+			offset=HEADER.size, shape=shape)
+
+	def chunks(self, steps=256):
+		""" Yields (first step, block of up to steps steps) """
+		data = self.array()
+		for first in range(0, self.steps, steps):
+			yield first, data[first:first + steps]
+
+	def __iter__(self):
+		"""
+		The (shapes, fields) block of each step, as numpy arrays, or as flat
+		array('f') without NumPy
+		"""
+		if numpy is not None:
+			for first, chunk in self.chunks():
+				for block in chunk:
+					yield block
+			return
+		if not self.steps or not self.block:
+			return
+		with open(self.filename, 'rb') as trajectory_file:
+			data = mmap(trajectory_file.fileno(), 0, access=ACCESS_READ)
+			try:
+				for step in range(self.steps):
+					offset = HEADER.size + step * self.block
+					values = array('f')
+					if hasattr(values, 'frombytes'):
+						values.frombytes(data[offset:offset + self.block])
+					else: # python 2
+						values.fromstring(data[offset:offset + self.block])
+					if sys.byteorder == 'big':
+						values.byteswap()
+					yield values
+			finally:
+				data.close()
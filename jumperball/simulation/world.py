@@ -25,14 +25,16 @@
 	Point, Line
 
   Shapes:
-    Circle, Triangle, Rectangle
+    Circle, Rectangle, Polygon (see shapes)
   
   World
     The world is the simulation container. You must add shape objects 
     to the world. When adding a object the object is either static or
     dynamic. Static objects can not be moved and will not collide with other 
     static objects. Dynamic objects are fully simulated.
-    
+    With set_focus only the shapes near an area (eg. the view) are
+    simulated, the far ones are frozen until the area comes near them.
+
   Special elements:
 	ContactPoint - A special point object which is internally used to 
 	mark the collision between two shapes.
@@ -44,94 +46,424 @@
 	
 """
 from math import sqrt, hypot, pi, sin, cos, atan2
+from itertools import chain, islice, repeat
+from operator import attrgetter
+from array import array
 from simulation.geometry import *
 from simulation.shapes import *
+from simulation.broadphase import *
+from simulation.segments import SegmentIndex
+from simulation.continuous import segment_toi, circle_toi
+from simulation.narrowphase import aabb_overlap, separation, \
+	segment_separation, support
+from simulation.profiler import PhaseProfiler
+from simulation.contacts import ContactBuffer
+from simulation.trajectory import TrajectoryRecorder
+
+# World.snapshot layout: the header values followed by the fields of each
+# shape, in the circle_shapes order
+SNAPSHOT_HEADER = ('count', 'gravity_x', 'gravity_y', 'damping', 'friction')
+SNAPSHOT_FIELDS = ('x', 'y', 'px', 'py', 'ax', 'ay', 'radius')
+
+def resize(buffer, size):
+	""" Grow or shrink an array to size items """
+	if len(buffer) < size:
+		buffer.extend(repeat(0.0, size - len(buffer)))
+	elif len(buffer) > size:
+		del buffer[size:]
 
 class World:
-	def __init__(self, width, height):
+	def __init__(self, width, height, broadphase=None):
 		self.circle_shapes = []
-		self.lines = []
+		self.polygon_shapes = [] # not in the snapshots
+		self.awake_shapes = []
+		self.sleeping_shapes = CircleGrid()
+		# pegs, bumpers... never moved, only tested against awake shapes
+		self.static_shapes = CircleGrid()
+		self.static_version = 0 # changed when a static shape is added or removed
+		self.broadphase = broadphase or UniformGrid()
+		self.lines = SegmentIndex()
 		self.width = width
 		self.height = height
 		self.damping = 0.90
 		self.gravity = Vector(0, 0)
 		self.friction = 0
+		self.substeps = 2
+		self.interpolation = False # keep the last step positions
+		# shapes slower than sleep_velocity for sleep_steps are put to sleep
+		self.sleep_velocity = 0.25
+		self.sleep_steps = 60 # 0 disables sleeping
+		self.contact_islands = {} # union find of the shapes in contact
+		self.wake_state = None
+		# the broadphase pairs closer than contact_margin are cached, and
+		# reused until a shape moves more than half of the margin
+		self.contact_margin = 8.0
+		self.contact_pairs = None
+		self.polygon_pairs = [] # cached pairs with a polygon, for the SAT
+		self.static_pairs = [] # cached (awake shape, static shape) pairs
+		self.contact_shapes = None # awake_shapes when the cache was built
+		self.contact_x = array('d') # positions when the cache was built
+		self.contact_y = array('d')
+		# the position correction is repeated until the biggest overlap is
+		# below overlap_tolerance, at most solver_iterations times
+		self.solver_iterations = 3
+		self.overlap_tolerance = 0.5
+		self.reset_contact_stats()
+		self.profiler = None # see profile()
+		self.contacts = None # see record_contacts()
+		self.trajectory = None # see record_trajectory()
+		# simulation level of detail: the awake shapes far from the focus
+		# area are frozen, as if sleeping, until the focus comes near them
+		self.focus = None # (left, top, right, bottom), see set_focus()
+		self.focus_margin = 400
+		self.frozen = {} # frozen shape -> its velocity (vx, vy)
+		self.thawed_focus = None # focus when the frozen shapes were checked
+		self.next_uid = 0 # the uid of the next shape added
 						
+	def reset_contact_stats(self):
+		self.contact_hits = 0 # collide passes which used the cached pairs
+		self.contact_builds = 0 # collide passes which ran the broadphase
+		self.solver_substeps = 0
+		self.solver_passes = 0 # position correction passes
+
+	def contact_stats(self):
+		""" Cache hit rate and position passes per substep """
+		passes = self.contact_hits + self.contact_builds
+		return {
+			'cache_hit_rate': float(self.contact_hits) / passes if passes else 0,
+			'cache_builds': self.contact_builds,
+			'solver_iterations': float(self.solver_passes) / self.solver_substeps
+				if self.solver_substeps else 0,
+		}
+
+	def profile(self, enabled=True, window=120):
+		"""
+		Start or stop timing the step phases, returns the PhaseProfiler
+		with the stats of the last window steps
+		"""
+		if enabled and self.profiler is None:
+			self.profiler = PhaseProfiler(window)
+			self.profiler.attach(self)
+		elif not enabled and self.profiler is not None:
+			self.profiler.detach()
+			self.profiler = None
+		return self.profiler
+
+	def record_contacts(self, enabled=True, capacity=256, min_impulse=0.0):
+		"""
+		Start or stop filling a ContactBuffer with the contacts resolved by
+		each step, returns the buffer
+		"""
+		if enabled and self.contacts is None:
+			self.contacts = ContactBuffer(capacity, min_impulse)
+		elif not enabled:
+			self.contacts = None
+		return self.contacts
+
+	def record_trajectory(self, filename=None, velocity=False, shapes=None):
+		"""
+		Start streaming the position (and velocity) of the shapes after
+		each step to a trajectory file, with room for shapes shapes (the
+		current ones by default), returns the TrajectoryRecorder. Each
+		shape is recorded in a column of its own, see TrajectoryRecorder.
+		Without a filename the recording is closed.
+		"""
+		if self.trajectory is not None:
+			self.trajectory.close()
+			self.trajectory = None
+		if filename:
+			if shapes is None:
+				shapes = len(self.circle_shapes) + len(self.polygon_shapes)
+			self.trajectory = TrajectoryRecorder(filename, shapes, velocity)
+		return self.trajectory
+
+	def contact_candidates(self):
+		""" The cached pairs of awake shapes which may be in contact """
+		shapes = self.awake_shapes
+		if self.contact_shapes is shapes and len(self.contact_x) == len(shapes):
+			limit = self.contact_margin * self.contact_margin / 4
+			for shape, x, y in zip(shapes, self.contact_x, self.contact_y):
+				dx, dy = shape.x - x, shape.y - y
+				if dx*dx + dy*dy > limit:
+					break
+			else:
+				self.contact_hits += 1
+				return self.contact_pairs
+		self.contact_builds += 1
+		margin = self.contact_margin
+		circles, polygons = shapes, []
+		if self.polygon_shapes:
+			# the polygons are paired apart, so that they do not grow the
+			# broadphase cells of the circles
+			circles = [shape for shape in shapes if not shape.polygon]
+			polygons = [shape for shape in shapes if shape.polygon]
+		pairs = self.close_pairs(circles, margin)
+		polygon_pairs = self.polygon_pairs = []
+		candidates = chain(box_pairs(polygons, circles, margin),
+			box_pairs(polygons, polygons, margin))
+		for shape1, shape2 in candidates:
+			if (not shape2.polygon or id(shape1) < id(shape2)) and \
+					aabb_overlap(shape1, shape2, margin):
+				polygon_pairs.append((shape1, shape2))
+		static_pairs = self.static_pairs = []
+		if self.static_shapes:
+			nearby = self.static_shapes.nearby
+			for shape in shapes:
+				x, y, radius = shape.x, shape.y, shape.radius
+				for other in nearby(x, y, radius + margin):
+					target = radius + other.radius + margin
+					if (x-other.x)**2 + (y-other.y)**2 < target*target:
+						static_pairs.append((shape, other))
+		self.contact_pairs = pairs
+		self.contact_shapes = shapes
+		# kept in arrays, without a float object per shape
+		self.contact_x[:] = array('d', map(attrgetter('x'), shapes))
+		self.contact_y[:] = array('d', map(attrgetter('y'), shapes))
+		return pairs
+
+	def close_pairs(self, circles, margin):
+		""" The broadphase pairs of circles closer than margin """
+		pairs = []
+		for pair in self.broadphase.pairs(circles, margin):
+			shape1, shape2 = pair
+			x, y = shape1.x - shape2.x, shape1.y - shape2.y
+			target = shape1.radius + shape2.radius + margin
+			if x*x + y*y < target*target:
+				pairs.append(pair)
+		return pairs
+
+	def forget_contacts(self):
+		""" Drop the cached pairs, when shapes are added or removed """
+		self.contact_shapes = None
+
 	def collide(self, preserve_impulse):
-		""" Check all bodies for collisions """
-		for i in range(len(self.circle_shapes)):
-			shape1 = self.circle_shapes[i]
-			for j in range(i+1, len(self.circle_shapes)):
-				shape2 = self.circle_shapes[j]
-				x, y = shape1.x - shape2.x, shape1.y - shape2.y
-				slength = float(x*x+y*y)
+		"""
+		Check the candidate pairs for collisions, returns the biggest
+		overlap found.
+		"""
+		pairs = self.contact_candidates()
+		polygon_pairs = self.polygon_pairs
+		if self.sleeping_shapes:
+			polygon_pairs = list(polygon_pairs)
+			pairs = chain(pairs, self.sleeping_pairs(polygon_pairs))
+		islands = self.sleep_steps
+		contacts = self.contacts
+		overlap = 0
+		for shape1, shape2 in pairs:
+			x, y = shape1.x - shape2.x, shape1.y - shape2.y
+			slength = float(x*x+y*y)
+			length = sqrt(slength)
+			target = shape1.radius + shape2.radius
+			if length < target: # Colision detected
+				if islands:
+					self.join_islands(shape1, shape2)
+				if target - length > overlap:
+					overlap = target - length
+
+				# record previous velocityy
+				v1x = shape1.x - shape1.px
+				v1y = shape1.y - shape1.py
+				v2x = shape2.x - shape2.px
+				v2y = shape2.y - shape2.py   
+				 
+				# resolve the shape overlap conflict
+				factor = (length-target)/length;
+				shape1.x -= x*factor*0.5;
+				shape1.y -= y*factor*0.5;
+				shape2.x += x*factor*0.5;
+				shape2.y += y*factor*0.5;			
+										
+				if preserve_impulse:
+					# compute the projected component factors					
+					f1 = (self.damping*(x*v1x+y*v1y))/slength
+					f2 = (self.damping*(x*v2x+y*v2y))/slength
+					
+					# swap the projected components						
+					v1x += f2*x - f1*x
+					v2x += f1*x - f2*x
+					v1y += f2*y - f1*y
+					v2y += f1*y - f2*y
+					
+					# the previous position is adjusted
+					# to represent the new velocity
+					shape1.px = shape1.x - v1x
+					shape1.py = shape1.y - v1y
+					shape2.px = shape2.x - v2x
+					shape2.py = shape2.y - v2y
+
+					if contacts is not None:
+						radius = shape1.radius / length
+						contacts.add(shape1.uid, shape2.uid, -1,
+							shape1.x - x*radius, shape1.y - y*radius,
+							abs(f2 - f1) * length)
+		if polygon_pairs:
+			overlap = max(overlap,
+				self.collide_polygons(polygon_pairs, preserve_impulse))
+		if self.static_shapes:
+			overlap = max(overlap, self.collide_static(preserve_impulse))
+		return overlap
+
+	def collide_static(self, preserve_impulse):
+		"""
+		Move the awake shapes out of the static shapes of the cached pairs,
+		the static shapes do not move, the normal velocity is reflected.
+		Returns the biggest overlap found.
+		"""
+		damping = self.damping
+		contacts = self.contacts
+		overlap = 0
+		for shape, other in self.static_pairs:
+			if shape.polygon:
+				contact = separation(other, shape)
+				if contact is None:
+					continue
+				depth, nx, ny = contact
+			else:
+				x, y = shape.x - other.x, shape.y - other.y
+				slength = x*x + y*y
+				target = shape.radius + other.radius
+				if slength >= target*target or not slength:
+					continue
 				length = sqrt(slength)
-				target = shape1.radius + shape2.radius
-				if length < target: # Colision detected
-				
-					# record previous velocityy
-					v1x = shape1.x - shape1.px
-					v1y = shape1.y - shape1.py
-					v2x = shape2.x - shape2.px
-					v2y = shape2.y - shape2.py   
-					 
-					# resolve the shape overlap conflict
-					factor = (length-target)/length;
-					shape1.x -= x*factor*0.5;
-					shape1.y -= y*factor*0.5;
-					shape2.x += x*factor*0.5;
-					shape2.y += y*factor*0.5;			
-											
-					if preserve_impulse:
-						# compute the projected component factors					
-						f1 = (self.damping*(x*v1x+y*v1y))/slength
-						f2 = (self.damping*(x*v2x+y*v2y))/slength
-						
-						# swap the projected components						
-						v1x += f2*x - f1*x
-						v2x += f1*x - f2*x
-						v1y += f2*y - f1*y
-						v2y += f1*y - f2*y
-						
-						# the previous position is adjusted
-						# to represent the new velocity
-						shape1.px = shape1.x - v1x
-						shape1.py = shape1.y - v1y
-						shape2.px = shape2.x - v2x
-						shape2.py = shape2.y - v2y
-						
+				depth, nx, ny = target - length, x/length, y/length
+			if depth > overlap:
+				overlap = depth
+			vx, vy = shape.x - shape.px, shape.y - shape.py
+			shape.x += nx*depth
+			shape.y += ny*depth
+			if preserve_impulse:
+				speed = vx*nx + vy*ny
+				if speed < 0: # moving into the static shape
+					vx -= (1 + damping)*speed*nx
+					vy -= (1 + damping)*speed*ny
+					if contacts is not None:
+						x, y = support(other, nx, ny)
+						contacts.add(shape.uid, other.uid, -1, x, y,
+							-speed*(1 + damping))
+				shape.px, shape.py = shape.x - vx, shape.y - vy
+		return overlap
+
+	def collide_polygons(self, pairs, preserve_impulse):
+		""" The collide pass of the pairs with a polygon """
+		islands = self.sleep_steps
+		damping = self.damping
+		contacts = self.contacts
+		overlap = 0
+		for shape1, shape2 in pairs:
+			if not aabb_overlap(shape1, shape2):
+				continue
+			contact = separation(shape1, shape2)
+			if contact is None:
+				continue
+			depth, nx, ny = contact
+			if islands:
+				self.join_islands(shape1, shape2)
+			if depth > overlap:
+				overlap = depth
+			v1x, v1y = shape1.x - shape1.px, shape1.y - shape1.py
+			v2x, v2y = shape2.x - shape2.px, shape2.y - shape2.py
+			# half of the overlap each, along the separating axis
+			shape1.x -= nx*depth*0.5
+			shape1.y -= ny*depth*0.5
+			shape2.x += nx*depth*0.5
+			shape2.y += ny*depth*0.5
+			if preserve_impulse:
+				# swap the velocity components along the axis, as in collide
+				f1 = damping*(nx*v1x + ny*v1y)
+				f2 = damping*(nx*v2x + ny*v2y)
+				shape1.px = shape1.x - (v1x + (f2-f1)*nx)
+				shape1.py = shape1.y - (v1y + (f2-f1)*ny)
+				shape2.px = shape2.x - (v2x + (f1-f2)*nx)
+				shape2.py = shape2.y - (v2y + (f1-f2)*ny)
+				if contacts is not None:
+					x, y = support(shape1, nx, ny)
+					contacts.add(shape1.uid, shape2.uid, -1, x, y, abs(f2 - f1))
+		return overlap
+					
 	def colide_with_lines(self, preserve_impulse):
-		for line in self.lines:				
-			for shape in self.circle_shapes:								
-				contact_point = line.contact_point(shape)
-				if contact_point is None:
+		""" Check all shapes against the nearby lines segment table """
+		index = self.lines
+		if not index.cells:
+			return
+		nearby = index.nearby
+		ox, oy, dx, dy = index.ox, index.oy, index.dx, index.dy
+		inverse, nx, ny = index.inverse, index.nx, index.ny
+		damping = self.damping
+		contacts = self.contacts
+		polygons = []
+		for shape in self.awake_shapes:
+			if shape.polygon:
+				polygons.append(shape)
+				continue
+			x, y, radius = shape.x, shape.y, shape.radius
+			for slot in nearby(x, y, radius):
+				# closest point of the segment, see Line.intersection_point
+				rx, ry = x - ox[slot], y - oy[slot]
+				ex, ey = dx[slot], dy[slot]
+				u = (rx*ex + ry*ey) * inverse[slot]
+				if 0 < u < 1: # inside the segment, use the segment normal
+					normal_x, normal_y = nx[slot], ny[slot]
+					distance = rx*normal_x + ry*normal_y
+					if distance < 0:
+						distance = -distance
+						normal_x, normal_y = -normal_x, -normal_y
+				else: # contact with one of the end points
+					if u >= 1:
+						rx, ry = rx - ex, ry - ey
+					distance = sqrt(rx*rx + ry*ry)
+					if not distance:
+						continue
+					normal_x, normal_y = rx/distance, ry/distance
+				if distance > radius:
 					continue
-				
+
 				# record velocity
-				v1x = (shape.x - shape.px) * self.damping
-				v1y = (shape.y - shape.py) * self.damping
-									
-				x, y = shape.x - contact_point.x, shape.y - contact_point.y
-				length = contact_point.distance_to(shape.center())
-				target = shape.radius
-				factor = (length-target)/float(length);
-				shape.x -= x*factor		
-				shape.y -= y*factor
-				
-				if preserve_impulse:		
-					factor_y = shape.radius*sin(atan2(int(y), int(x)))
-					factor_x = shape.radius*cos(atan2(int(y), int(x)))						
-					if abs(contact_point.y -  shape.y) <= shape.radius:
-						shape.py = contact_point.y+factor_y+v1y	
-					#if shape.x in [contact_point.x + shape.radius, contact_point.x - shape.radius]:
-					#if abs(contact_point.x -  shape.x) <= shape.radius:
-					#	#print factor_x
-					#	print shape.x, contact_point.x-factor_x
-					#	#shape.px = contact_point.x-x
-		
+				vy = y - shape.py
+				v1y = vy * damping
+
+				# move the shape out of the line along the contact normal
+				x += normal_x * (radius-distance)
+				y += normal_y * (radius-distance)
+				shape.x, shape.y = x, y
+
+				if preserve_impulse:
+					# reflect the vertical velocity
+					shape.py = y + v1y
+					if contacts is not None:
+						contacts.add(shape.uid, -1, slot, x - normal_x*radius,
+							y - normal_y*radius, abs(vy) + abs(v1y))
+		for shape in polygons:
+			self.polygon_with_lines(shape, preserve_impulse)
+
+	def polygon_with_lines(self, shape, preserve_impulse):
+		""" colide_with_lines for a polygon, with the SAT """
+		index = self.lines
+		ox, oy, dx, dy = index.ox, index.oy, index.dx, index.dy
+		nx, ny = index.nx, index.ny
+		for slot in index.nearby(shape.x, shape.y, shape.radius):
+			x, y = ox[slot], oy[slot]
+			contact = segment_separation(shape, x, y, x + dx[slot],
+				y + dy[slot], nx[slot], ny[slot])
+			if contact is None:
+				continue
+			depth, normal_x, normal_y = contact
+			vy = shape.y - shape.py
+			v1y = vy * self.damping
+			shape.x += normal_x * depth
+			shape.y += normal_y * depth
+			if preserve_impulse:
+				shape.py = shape.y + v1y
+				if self.contacts is not None:
+					x, y = support(shape, -normal_x, -normal_y)
+					self.contacts.add(shape.uid, -1, slot, x, y,
+						abs(vy) + abs(v1y))
+
 	def border_collide_preserve_impulse(self):
 		width, height = self.width, self.height
-		for shape in self.circle_shapes:
+		for shape in self.awake_shapes:
+			if shape.polygon:
+				self.polygon_border(shape, True)
+				continue
 			radius, x, y = shape.radius, shape.x, shape.y
 
 			if x-radius < 0:
@@ -154,7 +486,10 @@ class World:
 				
 	def border_collide(self):
 		width, height = self.width, self.height
-		for shape in self.circle_shapes:
+		for shape in self.awake_shapes:
+			if shape.polygon:
+				self.polygon_border(shape, False)
+				continue
 			radius, x, y = shape.radius, shape.x, shape.y
 			if x-radius < 0:
 				shape.x = radius
@@ -166,25 +501,390 @@ class World:
 			elif y + radius > height:
 				shape.y = height-radius
 
+	def polygon_border(self, shape, preserve_impulse):
+		""" The border collisions of a polygon, using its bounding box """
+		left, top, right, bottom = shape.aabb()
+		damping = self.damping
+		if left < 0:
+			move = -left
+		elif right > self.width:
+			move = self.width - right
+		else:
+			move = 0
+		if move:
+			vx = (shape.px - shape.x)*damping
+			shape.x += move
+			if preserve_impulse:
+				shape.px = shape.x - vx
+		if top < 0:
+			move = -top
+		elif bottom > self.height:
+			move = self.height - bottom
+		else:
+			move = 0
+		if move:
+			vy = (shape.py - shape.y)*damping
+			shape.y += move
+			if preserve_impulse:
+				shape.py = shape.y - vy
+
 	def apply_gravity(self):		
-		for shape in self.circle_shapes:
+		for shape in self.awake_shapes:
 			shape.ay += self.gravity.y
 			shape.ax += self.gravity.x
 
 	def apply_friction(self):	
-		for shape in self.circle_shapes:						
+		for shape in self.awake_shapes:						
 			shape.apply_friction(self.friction)
 		
 	def inertia(self):
-		for shape in self.circle_shapes:
+		for shape in self.awake_shapes:
 			shape.inertia()
 			
 	def accelerate(self, delta):
-		for shape in self.circle_shapes:
+		for shape in self.awake_shapes:
 			shape.accelerate(delta)			
 
+	def sleeping_pairs(self, polygon_pairs):
+		"""
+		Pairs of awake and sleeping shapes in contact, those are woken.
+		The pairs with a polygon are appended to polygon_pairs.
+		"""
+		sleeping_shapes = self.sleeping_shapes
+		for shape in list(self.awake_shapes):
+			x, y, radius = shape.x, shape.y, shape.radius
+			for other in sleeping_shapes.nearby(x, y, radius):
+				if not other.sleeping:
+					continue
+				if shape.polygon or other.polygon:
+					if aabb_overlap(shape, other):
+						self.wake(other)
+						polygon_pairs.append((shape, other))
+					continue
+				target = radius + other.radius
+				if (x-other.x)**2 + (y-other.y)**2 < target*target:
+					self.wake(other)
+					yield shape, other
+
+	def island(self, shape):
+		""" Returns the shape which represents the island of shape """
+		parents = self.contact_islands
+		root = shape
+		while root in parents:
+			root = parents[root]
+		while shape is not root: # path compression
+			parents[shape], shape = root, parents[shape]
+		return root
+
+	def join_islands(self, shape1, shape2):
+		root1, root2 = self.island(shape1), self.island(shape2)
+		if root1 is not root2:
+			self.contact_islands[root1] = root2
+
+	def update_sleep(self):
+		"""
+		Count for how many steps each awake shape has been almost stopped,
+		islands of shapes in contact where all the shapes are idle for
+		sleep_steps are put to sleep.
+		"""
+		limit = self.sleep_velocity ** 2
+		steps = self.sleep_steps
+		idle = False
+		for shape in self.awake_shapes:
+			vx, vy = shape.x - shape.px, shape.y - shape.py
+			if vx*vx + vy*vy < limit:
+				shape.idle += 1
+				idle = idle or shape.idle >= steps
+			else:
+				shape.idle = 0
+		if idle:
+			islands = {}
+			for shape in self.awake_shapes:
+				root = self.island(shape)
+				island = islands.get(root)
+				if island is None:
+					islands[root] = [shape]
+				else:
+					island.append(shape)
+			for island in islands.values():
+				for shape in island:
+					if shape.idle < steps:
+						break
+				else:
+					self.sleep(island)
+		self.contact_islands = {}
+
+	def sleep(self, island):
+		""" Stop and put to sleep a list of shapes """
+		for shape in island:
+			shape.sleeping = True
+			shape.island = island
+			shape.idle = 0
+			shape.px, shape.py = shape.x, shape.y
+			shape.lx, shape.ly = shape.x, shape.y
+			shape.ax = shape.ay = 0
+			self.sleeping_shapes.add(shape)
+		self.awake_shapes = [s for s in self.awake_shapes if not s.sleeping]
+
+	def wake(self, shape):
+		""" Wake shape and all the shapes sleeping on the same island """
+		if not shape.sleeping:
+			return
+		frozen = self.frozen
+		for member in shape.island:
+			member.sleeping = False
+			member.island = None
+			self.sleeping_shapes.remove(member)
+			self.awake_shapes.append(member)
+			if frozen and member in frozen:
+				vx, vy = frozen.pop(member)
+				member.px, member.py = member.x - vx, member.y - vy
+
+	def set_focus(self, left, top, right, bottom, margin=None):
+		"""
+		Only simulate the shapes near the area (eg. the viewport), the
+		shapes further than margin are frozen and thawed again with their
+		velocity when the area comes near them, or a shape hits them.
+		Setting focus to None thaws them all on the next step.
+		"""
+		self.focus = left, top, right, bottom
+		if margin is not None:
+			self.focus_margin = margin
+
+	def update_focus(self):
+		""" Freeze the awake shapes far from the focus, thaw the near ones """
+		left, top, right, bottom = self.focus
+		# shapes are frozen further than they are thawed, so that the
+		# shapes on the edge do not change every step
+		far = self.focus_margin * 1.5
+		left_far, top_far, right_far, bottom_far = left - far, top - far, \
+			right + far, bottom + far
+		outside = [shape for shape in self.awake_shapes
+			if not (left_far <= shape.x <= right_far and
+				top_far <= shape.y <= bottom_far)]
+		if outside:
+			self.freeze(outside)
+		if self.frozen and self.focus != self.thawed_focus:
+			self.thawed_focus = self.focus
+			margin = self.focus_margin
+			frozen = self.frozen
+			for shape in self.sleeping_shapes.query_box(left - margin,
+					top - margin, right + margin, bottom + margin):
+				if shape in frozen:
+					self.wake(shape)
+
+	def thaw(self):
+		""" Wake all the frozen shapes, with their velocity """
+		for shape in list(self.frozen):
+			self.wake(shape)
+		self.frozen.clear()
+		self.thawed_focus = None
+
+	def freeze(self, shapes):
+		""" Put awake shapes to sleep, each on its own, keeping the velocity """
+		for shape in shapes:
+			self.frozen[shape] = (shape.x - shape.px, shape.y - shape.py)
+		self.sleep(shapes)
+		for shape in shapes:
+			shape.island = [shape]
+
+	def wake_all(self):
+		for shape in list(self.sleeping_shapes):
+			self.wake(shape)
+
+	def check_wake_state(self):
+		""" Wake everything when the gravity, lines or statics are changed """
+		state = (self.gravity.x, self.gravity.y, self.lines.version,
+			self.static_version)
+		if state != self.wake_state:
+			self.wake_state = state
+			self.wake_all()
+
+	def sweep(self):
+		"""
+		Continuous collision for the awake shapes with continuous set,
+		those are moved back to their first contact on this substep and
+		bounced from there, so they can not pass through lines or shapes.
+		"""
+		# moving less than the radius is caught by the discrete tests
+		fast = [shape for shape in self.awake_shapes if shape.continuous and
+			(shape.x - shape.px)**2 + (shape.y - shape.py)**2 >
+			shape.radius*shape.radius]
+		if not fast:
+			return
+		boxes = SortedBoxes(self.awake_shapes)
+		# shapes already moved back to a contact, their previous position
+		# no longer is where they came from
+		swept = set()
+		for shape in fast:
+			if shape not in swept:
+				self.sweep_shape(shape, shape.x - shape.px, shape.y - shape.py,
+					swept, boxes)
+
+	def sweep_shape(self, shape, dx, dy, swept, boxes):
+		""" boxes is the SortedBoxes of the awake shapes, kept sorted """
+		x, y, radius = shape.px, shape.py, shape.radius
+		first, normal_x, normal_y, first_shape = 1, 0, 0, None
+		first_slot = -1
+
+		# lines near the swept area
+		index = self.lines
+		half = sqrt(dx*dx + dy*dy) / 2 + radius
+		for slot in index.nearby(x + dx/2, y + dy/2, half):
+			hit = segment_toi(x, y, dx, dy, radius, index.ox[slot],
+				index.oy[slot], index.dx[slot], index.dy[slot],
+				index.inverse[slot], index.nx[slot], index.ny[slot])
+			if hit is not None and hit[0] < first:
+				first, normal_x, normal_y = hit
+				first_slot = slot
+		# static shapes, they bounce the shape like the lines
+		first_static = None
+		for other in self.static_shapes.nearby(x + dx/2, y + dy/2, half):
+			t = circle_toi(x - other.x, y - other.y, dx, dy,
+				radius + other.radius)
+			if t is not None and t < first:
+				cx, cy = x + dx*t - other.x, y + dy*t - other.y
+				length = sqrt(cx*cx + cy*cy)
+				if length:
+					first, normal_x, normal_y = t, cx/length, cy/length
+					first_slot, first_static = -1, other
+		# other shapes near the swept area
+		left, right = min(x, x+dx) - radius, max(x, x+dx) + radius
+		top, bottom = min(y, y+dy) - radius, max(y, y+dy) + radius
+		others = self.sleeping_shapes.nearby(x + dx/2, y + dy/2, half)
+		for other in chain(boxes.query(left, right), others):
+			# the polygons are left to the discrete tests
+			if other is shape or other.polygon \
+				or other.x + other.radius < left \
+				or other.x - other.radius > right \
+				or other.y + other.radius < top \
+				or other.y - other.radius > bottom:
+				continue
+			if other in swept:
+				t = circle_toi(x - other.x, y - other.y, dx, dy,
+					radius + other.radius)
+			else:
+				t = circle_toi(x - other.px, y - other.py,
+					dx - (other.x - other.px), dy - (other.y - other.py),
+					radius + other.radius)
+			if t is not None and t < first:
+				first, first_shape = t, other
+
+		if first_shape is None and not (normal_x or normal_y):
+			return
+		swept.add(shape)
+		# stop just before the contact, so that the discrete tests do not
+		# bounce the shapes again
+		first = max(0, first - 0.001)
+		# move to the contact point, keeping the velocity
+		left = shape.x - radius
+		shape.x, shape.y = x + dx*first, y + dy*first
+		shape.px, shape.py = shape.x - dx, shape.y - dy
+		boxes.move(shape, left)
+		if first_shape is None:
+			# bounce from the line, the normal velocity is reversed
+			speed = (dx*normal_x + dy*normal_y) * (1 + self.damping)
+			shape.px += speed*normal_x
+			shape.py += speed*normal_y
+			if self.contacts is not None:
+				self.contacts.add(shape.uid,
+					first_static.uid if first_static else -1, first_slot,
+					shape.x - normal_x*radius, shape.y - normal_y*radius,
+					abs(speed))
+			return
+		other = first_shape
+		if other.sleeping:
+			island = other.island
+			self.wake(other)
+			for member in island:
+				boxes.add(member)
+		v2x, v2y = other.x - other.px, other.y - other.py
+		if other not in swept:
+			left = other.x - other.radius
+			other.x, other.y = other.px + v2x*first, other.py + v2y*first
+			boxes.move(other, left)
+			swept.add(other)
+		# swap the projected velocity components, as in collide
+		x, y = shape.x - other.x, shape.y - other.y
+		slength = float(x*x + y*y)
+		f1 = (self.damping*(x*dx + y*dy))/slength
+		f2 = (self.damping*(x*v2x + y*v2y))/slength
+		shape.px = shape.x - (dx + (f2-f1)*x)
+		shape.py = shape.y - (dy + (f2-f1)*y)
+		other.px = other.x - (v2x + (f1-f2)*x)
+		other.py = other.y - (v2y + (f1-f2)*y)
+		if self.contacts is not None:
+			length = sqrt(slength)
+			self.contacts.add(shape.uid, other.uid, -1,
+				shape.x - x*radius/length, shape.y - y*radius/length,
+				abs(f2 - f1) * length)
+
+	def snapshot(self, buffer=None):
+		"""
+		Store the dynamic state in a flat array('d'), buffer is reused
+		when given. Returns the buffer.
+		"""
+		shapes = self.circle_shapes
+		header, fields = len(SNAPSHOT_HEADER), len(SNAPSHOT_FIELDS)
+		if buffer is None:
+			buffer = array('d')
+		resize(buffer, header + len(shapes)*fields)
+		buffer[0], buffer[1], buffer[2] = len(shapes), self.gravity.x, self.gravity.y
+		buffer[3], buffer[4] = self.damping, self.friction
+		self.snapshot_shapes(buffer, header)
+		return buffer
+
+	def snapshot_shapes(self, buffer, start):
+		get = attrgetter(*SNAPSHOT_FIELDS)
+		buffer[start:] = array('d', chain.from_iterable(map(get, self.circle_shapes)))
+
+	def restore(self, buffer):
+		"""
+		Restore the state stored by snapshot. The existing shapes are
+		updated in place, shapes are only added or removed when the count
+		is different.
+		"""
+		count = int(buffer[0])
+		self.gravity = Vector(buffer[1], buffer[2])
+		self.damping, self.friction = buffer[3], buffer[4]
+		# the sleep state is not stored, start again with everything awake
+		self.wake_all()
+		self.contact_islands = {}
+		self.forget_contacts()
+		shapes = self.circle_shapes
+		while len(shapes) > count:
+			self.remove(shapes[-1])
+		while len(shapes) < count:
+			self.add(CircleShape(Point(0, 0), 1))
+		for shape in shapes:
+			shape.idle = 0
+		self.restore_shapes(buffer, len(SNAPSHOT_HEADER))
+
+	def restore_shapes(self, buffer, start):
+		values = islice(buffer, start, None)
+		for shape, (x, y, px, py, ax, ay, radius) in zip(self.circle_shapes,
+				zip(*[values] * len(SNAPSHOT_FIELDS))):
+			shape.x, shape.y, shape.px, shape.py = x, y, px, py
+			shape.ax, shape.ay, shape.radius = ax, ay, radius
+			shape.lx, shape.ly = x, y
+
+	def store_positions(self):
+		""" Remember the positions before the step, for interpolation """
+		for shape in self.awake_shapes:
+			shape.lx, shape.ly = shape.x, shape.y
+
 	def step(self):
-		steps = 2
+		if self.contacts is not None:
+			self.contacts.clear()
+		if self.sleep_steps:
+			self.check_wake_state()
+		if self.focus is not None:
+			self.update_focus()
+		elif self.frozen: # the focus was cleared
+			self.thaw()
+		if self.interpolation:
+			self.store_positions()
+		steps = self.substeps
 		delta = 1.0/steps
 		for i in range(steps):
 			if self.friction:			
@@ -192,23 +892,72 @@ class World:
 			self.apply_gravity()		
 			self.accelerate(delta)
 			self.colide_with_lines(True)
-			self.collide(False)
+			self.solve_overlaps()
 			self.border_collide()			
 			self.inertia()	
+			self.sweep()
 			self.collide(True)
 			self.border_collide_preserve_impulse()
+		if self.sleep_steps:
+			self.update_sleep()
+		if self.trajectory is not None:
+			shapes = self.circle_shapes
+			if self.polygon_shapes:
+				shapes = shapes + self.polygon_shapes
+			self.trajectory.record(shapes)
 			
+	def solve_overlaps(self):
+		""" Repeat the position correction until the shapes barely overlap """
+		self.solver_substeps += 1
+		for i in range(self.solver_iterations):
+			self.solver_passes += 1
+			if self.collide(False) <= self.overlap_tolerance:
+				break
+
+	def shapes_in(self, left, top, right, bottom):
+		""" The shapes which are not static and may overlap the box """
+		found = [shape for shape in self.awake_shapes
+			if shape.x + shape.radius >= left and shape.x - shape.radius <= right
+			and shape.y + shape.radius >= top and shape.y - shape.radius <= bottom]
+		found.extend(self.sleeping_shapes.query_box(left, top, right, bottom))
+		return found
+
 	def shape_list(self, shape):
 		if isinstance(shape, CircleShape):
 			return self.circle_shapes
+		if isinstance(shape, PolygonShape):
+			return self.polygon_shapes
 			
-	def add(self, shape):
-		""" Add a shape to the world """
+	def add(self, shape, static=False):
+		"""
+		Add a shape to the world, static circles are never moved and only
+		collide with the shapes which are not static
+		"""
+		shape.uid = self.next_uid
+		self.next_uid += 1
+		if static:
+			if shape.polygon:
+				raise TypeError("only circles can be static")
+			self.static_shapes.add(shape)
+			self.static_version += 1
+			self.forget_contacts()
+			return
 		shape_list = self.shape_list(shape)
 		shape_list.append(shape)
+		self.awake_shapes.append(shape)
+		self.forget_contacts()
 			
 	def remove(self, shape):
+		if shape in self.static_shapes:
+			self.static_shapes.remove(shape)
+			self.static_version += 1
+			self.forget_contacts()
+			return
+		# the shapes sleeping on it lose their support
+		self.wake(shape)
 		shape_list = self.shape_list(shape)
 		shape_list.remove(shape)
+		self.awake_shapes.remove(shape)
+		self.forget_contacts()
 			
 			
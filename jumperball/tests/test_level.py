@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from simulation.geometry import Point, Line
+from simulation.level import LevelFile, HEADER, BATCH, RECORD, line_key, \
+	line_normal
+from simulation.segments import SegmentIndex
+
+def make_lines(count, offset=0):
+	return [Line(Point(i*10 + offset, i*5), Point(i*10 + offset + 7, i*5 + 30))
+		for i in range(count)]
+
+def keys(lines):
+	return sorted(line_key(line) for line in lines)
+
+class LevelFileTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.filename = os.path.join(self.directory, 'lines.level')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def stored(self):
+		return [line for line, normal in LevelFile(self.filename).read()]
+
+	def test_round_trip(self):
+		lines = make_lines(5)
+		level = LevelFile(self.filename)
+		level.save(lines)
+		read = LevelFile(self.filename).read()
+		self.assertEqual([line_key(line) for line, normal in read],
+			[line_key(line) for line in lines])
+		for (line, normal), original in zip(read, lines):
+			for value, expected in zip(normal, line_normal(original)):
+				self.assertAlmostEqual(value, expected)
+
+		# the changes are appended as a new batch
+		lines = lines[1:] + make_lines(2, offset=3)
+		self.assertEqual(level.save(lines), 3)
+		self.assertEqual(keys(self.stored()), keys(lines))
+		self.assertEqual(level.save(lines), 0)
+
+		index = SegmentIndex()
+		loaded = LevelFile(self.filename).load(index)
+		self.assertEqual(len(index), len(lines))
+		self.assertEqual(keys(loaded), keys(lines))
+
+	def test_duplicate_lines(self):
+		line = make_lines(1)[0]
+		level = LevelFile(self.filename)
+		level.save([line, line, line])
+		level.save([line])
+		self.assertEqual(len(self.stored()), 1)
+
+	def test_torn_tail(self):
+		first = make_lines(4)
+		level = LevelFile(self.filename)
+		level.save(first)
+		size = os.path.getsize(self.filename)
+		level.save(first + make_lines(3, offset=5))
+		# the last save stopped in the middle of its records
+		with open(self.filename, 'r+b') as level_file:
+			level_file.truncate(size + BATCH.size + RECORD.size + 3)
+		self.assertEqual(keys(self.stored()), keys(first))
+
+		# the next save overwrites the torn batch
+		level = LevelFile(self.filename)
+		second = first + make_lines(2, offset=9)
+		level.save(second)
+		self.assertEqual(keys(self.stored()), keys(second))
+
+	def test_corrupt_batch(self):
+		first = make_lines(3)
+		level = LevelFile(self.filename)
+		level.save(first)
+		size = os.path.getsize(self.filename)
+		level.save(first[:1])
+		with open(self.filename, 'r+b') as level_file:
+			level_file.seek(size + BATCH.size + 8)
+			level_file.write(b'\xff\xff\xff\xff')
+		self.assertEqual(keys(self.stored()), keys(first))
+
+	def test_compaction(self):
+		level = LevelFile(self.filename, compact_ratio=2, compact_minimum=8)
+		lines = make_lines(4)
+		level.save(lines)
+		for step in range(10):
+			# replace a line on every save
+			lines = lines[1:] + make_lines(1, offset=step*100 + 1)
+			level.save(lines)
+			self.assertEqual(keys(self.stored()), keys(lines))
+			self.assertTrue(level.records <= 8 + 2)
+		# rewritten with only the live lines
+		level.compact(lines)
+		self.assertEqual(os.path.getsize(self.filename),
+			HEADER.size + BATCH.size + len(lines)*RECORD.size)
+		self.assertEqual(keys(self.stored()), keys(lines))
+		self.assertFalse(os.path.exists(self.filename + '.new'))
+
+	def test_not_a_level(self):
+		with open(self.filename, 'wb') as level_file:
+			level_file.write(b'0 0 10 10\n' * 4)
+		self.assertRaises(ValueError, LevelFile(self.filename).read)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from math import cos, sin, pi
+
+from simulation.geometry import Point, Line
+from simulation.segments import SegmentIndex
+from simulation.simplify import merge, merge_line, simplify, segment_distance
+
+def arc_points(radius=100, count=200, angle=pi):
+	return [Point(200 + radius*cos(angle*i/(count - 1)),
+		200 + radius*sin(angle*i/(count - 1))) for i in range(count)]
+
+def polyline(points):
+	return [Line(A, B) for A, B in zip(points, points[1:])]
+
+def deviation(points, lines):
+	""" Largest distance from the points to the nearest of the lines """
+	worst = 0
+	for P in points:
+		nearest = None
+		for line in lines:
+			A, B = line.A, line.B
+			length = ((B.x - A.x)**2 + (B.y - A.y)**2) ** 0.5
+			distance = segment_distance(P.x, P.y, A.x, A.y,
+				(B.x - A.x) / length, (B.y - A.y) / length, length)
+			if nearest is None or distance < nearest:
+				nearest = distance
+		worst = max(worst, nearest)
+	return worst
+
+class SimplifyTest(unittest.TestCase):
+	tolerance = 0.5
+
+	def test_collinear_merge(self):
+		line = merge(Line(Point(0, 0), Point(10, 0)),
+			Line(Point(10, 0), Point(25, 0.2)), self.tolerance)
+		self.assertEqual((line.A.x, line.B.x), (0, 25))
+		self.assertEqual(merge(Line(Point(0, 0), Point(10, 0)),
+			Line(Point(10, 0), Point(20, 5)), self.tolerance), None)
+
+	def test_arc_drawn(self):
+		# the lines are merged one at a time, as they are drawn
+		points = arc_points()
+		index = SegmentIndex()
+		for line in polyline(points):
+			index.append(line)
+			merge_line(index, line, self.tolerance)
+		self.assertTrue(len(index) < len(points) - 1)
+		self.assertTrue(deviation(points, index) <= self.tolerance)
+
+	def test_arc_simplified(self):
+		points = arc_points()
+		index = SegmentIndex(polyline(points))
+		removed = simplify(index, self.tolerance)
+		self.assertEqual(len(index), len(points) - 1 - removed)
+		self.assertTrue(len(index) < len(points) - 1)
+		self.assertTrue(deviation(points, index) <= self.tolerance)
+		# a second pass keeps the points it replaced in the first one
+		simplify(index, self.tolerance)
+		self.assertTrue(deviation(points, index) <= self.tolerance)
+
+	def test_removed_line_points(self):
+		index = SegmentIndex(polyline(arc_points()))
+		simplify(index, self.tolerance)
+		for line in list(index):
+			index.remove(line)
+		self.assertEqual(index.line_points, {})
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from simulation.geometry import Point, Vector
+from simulation.shapes import CircleShape
+from simulation.trajectory import TrajectoryReader
+from simulation.world import World
+try:
+	from simulation.arrayworld import ArrayWorld
+except ImportError: # no NumPy
+	ArrayWorld = None
+
+class TrajectoryColumnsTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.filename = os.path.join(self.directory, 'run.traj')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def record(self, world_class):
+		"""
+		Three balls: one resting on the floor falls asleep while the others
+		fall, the second is removed. Returns the x, y of each step and
+		column.
+		"""
+		world = world_class(400, 400)
+		world.gravity = Vector(0, 0.2)
+		world.sleep_steps = 10
+		resting = world.add(CircleShape(Point(50, 390), 10)) or \
+			world.circle_shapes[-1]
+		world.add(CircleShape(Point(200, 100), 10))
+		removed = world.circle_shapes[-1]
+		world.add(CircleShape(Point(300, 20), 10))
+		world.record_trajectory(self.filename)
+		for step in range(40):
+			world.step()
+		self.assertTrue(resting.sleeping)
+		world.remove(removed)
+		for step in range(20):
+			world.step()
+		world.record_trajectory(None)
+		return [[(block[column][0], block[column][1]) for column in range(3)]
+			for block in TrajectoryReader(self.filename)]
+
+	def check_columns(self, steps):
+		self.assertEqual(len(steps), 60)
+		# no column jumps between steps
+		for column in range(3):
+			for before, after in zip(steps[:40], steps[1:40]):
+				self.assertTrue(abs(after[column][0] - before[column][0]) < 20)
+				self.assertTrue(abs(after[column][1] - before[column][1]) < 20)
+		for step in steps:
+			self.assertAlmostEqual(step[0][0], 50, 3) # the sleeping ball
+			self.assertAlmostEqual(step[2][0], 300, 3)
+		# the removed ball keeps its column, NaN once it is removed
+		for step in steps[40:]:
+			x, y = step[1]
+			self.assertTrue(x != x and y != y)
+
+	def test_world(self):
+		self.check_columns(self.record(World))
+
+	@unittest.skipIf(ArrayWorld is None, "needs NumPy")
+	def test_array_world(self):
+		self.check_columns(self.record(ArrayWorld))
+
+if __name__ == '__main__':
+	unittest.main()